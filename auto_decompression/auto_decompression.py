@@ -6,32 +6,37 @@ import shutil
 import traceback
 import argparse
 import extract_hidden_zip as hiddenZip
+import extraction
 import send2trash
-from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
 import rich.progress
 import requests
 from platformdirs import PlatformDirs
 import datetime as _dt
 import atexit
 import time
+import threading
+from collections import deque
 from extraction import (
     extract_with_7zip,
     handle_bandizip_extraction,
+    list_archive_entries,
     manual_password_entry,
+    plan_password_probe,
     try_passwords,
+    verify_password,
 )
 from housekeeping import (
     RECOVER_SUFFIX,
-    _RECYCLED_RESERVED_PATHS,
     _ensure_directory,
     _is_reserved_path,
     _normalize_path_for_compare,
     _pick_unique_name,
+    commit_entries,
     create_unique_directory,
     detect_single_same_named_file,
     move_file_with_unique_suffix,
-    move_path_with_collision_handling,
     move_temp_folders_to_recycle_bin,
     print_error,
     print_info,
@@ -40,17 +45,45 @@ from housekeeping import (
     remove_autodec_files,
     should_flatten_prefixed_files,
 )
+from gist_sync import (
+    GIST_API_URL,
+    GIST_EXIT_TIMEOUT,
+    GIST_REQUEST_TIMEOUT,
+    GistSyncState,
+    GistSyncWorker,
+    merge_dictionaries,
+)
+from password_store import PasswordStore
+from batch_journal import NULL_JOURNAL_ENTRY, BatchJournal
+from password_requests import PasswordNeeded, PasswordRequestQueue
+from dedup import DEDUP_MODES, DEFAULT_DEDUP_MODE, InputDeduplicator, replicate_outputs, same_content
+from instance_channel import FileManager, send_file_to_main_instance, send_request
+from progress_display import (
+    console as shared_console,
+    create_shared_progress,
+    set_shared_progress,
+)
+from password_cache import (
+    DEFAULT_CACHE_CAPACITY,
+    PasswordCache,
+    compute_archive_fingerprint,
+)
+from password_ranking import PasswordRanker
+from scheduler import DEFAULT_MAX_JOBS, DEFAULT_MAX_JOBS_PER_DEVICE, ExtractionScheduler
+from staging import configure_staging, is_staged, parse_size, reserve_stage_folder
+from tracing import start_tracing, stop_tracing, trace_span
 from structure import (
     filter_non_primary_split_inputs,
     get_archive_base_name,
-    group_archive_files,
-    is_likely_archive_filename,
+    get_directory_index,
     list_related_archive_parts,
+    predict_layer_shape,
+    recursion_candidates,
 )
 
 
 __version__ = "1.2.1"
-console = Console()
+console = shared_console
 _dirs = PlatformDirs(appname="auto_decompression", appauthor="NordLandeW")
 CONFIG_DIR = _dirs.user_config_dir
 DATA_DIR = _dirs.user_data_dir
@@ -59,8 +92,25 @@ extract_to_base_folder = False
 auto_flatten_single_file = True
 pwdFilename = "dict.json"
 pwdDictionary = {}
+PWD_CACHE_FILENAME = "password_cache.json"
+PWD_STATS_FILENAME = "dict_stats.json"
+_password_ranker = None  # PasswordRanker，跨批次保持预排序的候选密码
+_password_cache = None  # PasswordCache，按压缩包指纹记忆成功的密码
+_password_store = None  # PasswordStore，密码本快照 + 追加写入的变更日志
 DEFAULT_EMBEDDED_SCAN_MAX_LEVEL = 2  # Max recursion depth to check for hidden embedded files
 embedded_scan_depth_setting = DEFAULT_EMBEDDED_SCAN_MAX_LEVEL
+DEFAULT_PROBE_JOBS = 1  # Number of concurrent `7z t` password probes; 1 keeps sequential extraction attempts
+probe_jobs_setting = DEFAULT_PROBE_JOBS
+stream_nested_setting = True  # 只含单个内层压缩包的中间层解压到内存文件系统
+selective_nested_setting = True  # 中间层只解压内层压缩包，跳过用于混淆的小文件
+dedup_mode_setting = DEFAULT_DEDUP_MODE
+_input_deduplicator = None  # InputDeduplicator，同一批次内内容相同的压缩包只解压一次
+BATCH_JOURNAL_FILENAME = "batch_journal.jsonl"
+_batch_journal = None  # BatchJournal，记录每个输入的进度，中断后重新运行时从断点继续
+daemon_mode_setting = False  # 守护进程模式：不等待任何控制台输入，持续接收其他实例推送的文件
+DAEMON_POLL_INTERVAL = 1.0  # Seconds the idle daemon waits for pushed files per poll
+PASSWORD_REQUESTS_FILENAME = "password_requests.json"
+_password_requests = None  # PasswordRequestQueue，守护进程模式下等待手动密码的输入
 CLI_ARGS = None
 SMALL_NON_ARCHIVE_IGNORE_THRESHOLD = 20 * 1024  # Threshold in bytes to ignore small non-archive files during recursion
 
@@ -69,6 +119,9 @@ GIST_CONFIG_FILE = "gist_config.json"
 _gist_cfg = None  # {token:str, gist_id:str, file:str}
 _gist_remote_ts = None  # 上一次拉取时远程文件 updated_at（datetime）
 _skip_gist_sync = False
+GIST_SYNC_STATE_FILENAME = "gist_sync_state.json"
+_gist_sync_state = None  # GistSyncState，记录上一次与 Gist 一致时的密码本（三方合并的基准）
+_gist_worker = None  # GistSyncWorker，在后台上传密码本
 
 
 def _cfg_path(fname):
@@ -92,6 +145,13 @@ def _save_gist_config(cfg):
     except Exception as e:
         print_warning(f"保存 Gist 配置失败喵：{e}")
 
+def _gist_api_url(cfg):
+    return cfg.get("api_url", GIST_API_URL).rstrip("/")
+
+def _mark_gist_synced(dictionary, remote_ts_str=None):
+    if _gist_sync_state is not None:
+        _gist_sync_state.mark_synced(dictionary, remote_ts_str)
+
 def _gist_headers(token):
     return {
         "Authorization": f"Bearer {token}",
@@ -107,8 +167,9 @@ def _fetch_from_gist(cfg):
     """
     try:
         r = requests.get(
-            f"https://api.github.com/gists/{cfg['gist_id']}",
+            f"{_gist_api_url(cfg)}/gists/{cfg['gist_id']}",
             headers=_gist_headers(cfg['token']),
+            timeout=GIST_REQUEST_TIMEOUT,
         )
         if r.status_code == 200:
             gist = r.json()
@@ -124,9 +185,10 @@ def _update_gist(cfg, content_str):
     try:
         payload = {"files": {cfg["file"]: {"content": content_str}}}
         r = requests.patch(
-            f"https://api.github.com/gists/{cfg['gist_id']}",
+            f"{_gist_api_url(cfg)}/gists/{cfg['gist_id']}",
             headers=_gist_headers(cfg['token']),
             json=payload,
+            timeout=GIST_REQUEST_TIMEOUT,
         )
         return r.status_code == 200
     except Exception as e:
@@ -139,7 +201,12 @@ def _create_new_gist(token, file_name):
         "public": False,
         "files": {file_name: {"content": "{}"}},
     }
-    r = requests.post("https://api.github.com/gists", headers=_gist_headers(token), json=payload)
+    r = requests.post(
+        f"{GIST_API_URL}/gists",
+        headers=_gist_headers(token),
+        json=payload,
+        timeout=GIST_REQUEST_TIMEOUT,
+    )
     if r.status_code == 201:
         return r.json()["id"]
     print_error(f"创建 Gist 失败喵：{r.text}")
@@ -171,7 +238,7 @@ def _setup_gist_interactive():
             # 远程 Gist 存在且可访问
             if has_local_pwd:
                 # 本地和远程都存在，询问用户选择
-                local_mtime = _dt.datetime.fromtimestamp(os.path.getmtime(local_pwd_path), tz=_dt.timezone.utc)
+                local_mtime = _local_dict_mtime()
                 remote_ts = _dt.datetime.fromisoformat(remote_ts_str.replace("Z", "+00:00")) if remote_ts_str else None
                 
                 print_info(f"检测到本地密码本（最后修改时间：{local_mtime.astimezone().strftime('%Y-%m-%d %H:%M:%S')}）")
@@ -189,12 +256,14 @@ def _setup_gist_interactive():
                     pwdDictionary = remote_dict
                     _gist_remote_ts = remote_ts
                     save_passwords()
+                    _mark_gist_synced(remote_dict, remote_ts_str)
                     print_success("已从 Gist 拉取密码本喵！")
             else:
                 # 本地不存在但远程存在，直接拉取
                 pwdDictionary = remote_dict
                 _gist_remote_ts = _dt.datetime.fromisoformat(remote_ts_str.replace("Z", "+00:00")) if remote_ts_str else None
                 save_passwords()
+                _mark_gist_synced(remote_dict, remote_ts_str)
                 print_success("已从 Gist 拉取密码本喵！")
         else:
             # 远程 Gist 不存在或无法访问
@@ -217,6 +286,9 @@ def _setup_gist_interactive():
 def _ensure_gist_config():
     cfg = _load_gist_config()
     if cfg is None:
+        if daemon_mode_setting:
+            print_info("未配置 Gist 喵，守护进程模式下不启动同步向导，本次不同步密码本。")
+            return None
         cfg = _setup_gist_interactive()
     return cfg
 
@@ -282,13 +354,110 @@ def parse_cli_arguments(argv):
     parser.add_argument(
         "--check-dict-conflict-on-startup",
         action="store_true",
-        help="程序启动后立即检查本地密码本与 Gist 是否一致；若冲突则交互询问处理方式。",
+        help="程序启动后立即检查本地密码本与 Gist 是否一致；若不一致则自动合并双方的改动。",
     )
     parser.add_argument(
         "--use-binwalk",
         action="store_true",
         help="启用 binwalk 进行隐藏嵌入文件判定喵（默认关闭，使用手写签名搜索）。",
     )
+    parser.add_argument(
+        "--embedded-scan-window",
+        choices=hiddenZip.SCAN_STRATEGIES,
+        default=hiddenZip.SCAN_STRATEGY,
+        help="手写签名搜索的扫描顺序喵：full 完整扫描；head-first 先搜索文件开头 64 MB，找到嵌入压缩包即停止；tail-first 先搜索末尾 64 MB，只有能通过文件头校验确认起点的 ZIP / 7z 才会提前停止。",
+    )
+    parser.add_argument(
+        "--probe-jobs",
+        type=int,
+        default=DEFAULT_PROBE_JOBS,
+        metavar="N",
+        help="字典密码猜测时同时运行的 `7z t` 探测进程数量喵，大于 1 时先并发验证密码再解压。",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_MAX_JOBS,
+        metavar="N",
+        help="同时解压的顶层压缩包数量喵，大于 1 时不同压缩包并发解压并共用一个进度面板。",
+    )
+    parser.add_argument(
+        "--jobs-per-device",
+        type=int,
+        default=DEFAULT_MAX_JOBS_PER_DEVICE,
+        metavar="N",
+        help="并发解压时同一磁盘设备上最多同时进行的任务数量喵。",
+    )
+    parser.add_argument(
+        "--stream-nested",
+        type=str2bool,
+        default=True,
+        metavar="{true,false}",
+        help="中间层只包含单个压缩包时，将其解压到内存文件系统（/dev/shm）再继续递归，只有最后一层写入磁盘喵（默认 true）。",
+    )
+    parser.add_argument(
+        "--staging-dir",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="中间层的暂存目录喵，可指定内存盘或高速磁盘，默认使用 /dev/shm。",
+    )
+    parser.add_argument(
+        "--staging-budget",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help="同时暂存的中间层总大小上限喵（如 512M、4G），超出预算的层直接解压到目标磁盘；默认只受暂存目录剩余空间限制。",
+    )
+    parser.add_argument(
+        "--selective-nested",
+        type=str2bool,
+        default=True,
+        metavar="{true,false}",
+        help="根据压缩包列表判断出中间层只含一个内层压缩包（及混淆用的小文件）时，只解压该内层压缩包喵（默认 true）。",
+    )
+    parser.add_argument(
+        "--dedup-inputs",
+        choices=DEDUP_MODES,
+        default=DEFAULT_DEDUP_MODE,
+        help="同一批次中内容完全相同的压缩包只解压一次喵：copy 将解压结果复制给其余副本；link 尽量使用硬链接；skip 跳过其余副本并提示；off 关闭去重。",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str2bool,
+        default=True,
+        metavar="{true,false}",
+        help="在数据目录中记录批处理进度喵：中断后用相同文件重新运行时，跳过已完成的压缩包，并沿用已找到的密码、不再重复尝试已排除的密码（默认 true）。",
+    )
+    parser.add_argument(
+        "--password-cache-size",
+        type=int,
+        default=DEFAULT_CACHE_CAPACITY,
+        metavar="N",
+        help="按压缩包内容指纹记忆成功密码的最大条目数喵，超出后淘汰最久未使用的条目，设为 0 可禁用。",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="记录每一层解压各阶段（密码验证、7z 解压、嵌入扫描、移动等）的耗时，写入数据目录下的 JSONL 文件并在退出时输出汇总表喵。",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="以守护进程模式运行喵：从不等待控制台输入，处理完后继续等待其他实例推送的文件；字典中没有密码的压缩包会放入待输入密码队列，不阻塞其他任务。",
+    )
+    parser.add_argument(
+        "--password-requests",
+        action="store_true",
+        help="列出正在运行的实例中等待输入密码的压缩包并退出喵。",
+    )
+    parser.add_argument(
+        "--answer-password",
+        nargs=2,
+        metavar=("ID", "PASSWORD"),
+        help="为正在运行的实例中编号为 ID 的待输入密码压缩包提供密码并退出喵，该压缩包会重新排队解压。",
+    )
     parser.add_argument(
         "files",
         nargs="*",
@@ -299,25 +468,39 @@ def parse_cli_arguments(argv):
 
 
 
+def _get_password_store():
+    global _password_store
+    pwdPath = os.path.join(DATA_DIR, pwdFilename)
+    if _password_store is None or _password_store.path != pwdPath:
+        _password_store = PasswordStore(pwdPath)
+    return _password_store
+
+
+def _local_dict_mtime():
+    """Last time the local dictionary changed: dict.json or its change log, whichever is newer."""
+    store = _get_password_store()
+    mtimes = [os.path.getmtime(path) for path in (store.path, store.log_path) if os.path.exists(path)]
+    if not mtimes:
+        return None
+    return _dt.datetime.fromtimestamp(max(mtimes), tz=_dt.timezone.utc)
+
+
 def read_passwords():
     global pwdDictionary
-    pwdPath = os.path.join(DATA_DIR, pwdFilename)
     try:
-        with open(pwdPath, "r", encoding="utf-8") as file:
-            pwdDictionary = json.load(file)
+        pwdDictionary = _get_password_store().load()
     except Exception as e:
         print_warning(f"读取文件错误喵！错误信息：{e}")
 
 
 def save_passwords():
-    # print(str(pwdDictionary))
-    pwdPath = os.path.join(DATA_DIR, pwdFilename)
+    """Appends this batch's changes to the change log; rewrites dict.json only on compaction."""
     try:
-        with open(pwdPath, "w", encoding="utf-8") as file:
-            json.dump(pwdDictionary, file, ensure_ascii=False, indent=4)
-        # print(f"密码已成功保存到 {pwdPath} 喵～")
+        _get_password_store().flush(pwdDictionary, _password_lock)
     except Exception as e:
         print_warning(f"保存密码时出错喵！请检查文件权限或路径。错误信息：{e}")
+    if _password_ranker is not None:
+        _password_ranker.save()
 
 
 def _pull_from_gist_if_possible():
@@ -330,6 +513,7 @@ def _pull_from_gist_if_possible():
         pwdDictionary = remote_dict
         _gist_remote_ts = _dt.datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else None
         save_passwords()
+        _mark_gist_synced(remote_dict, ts)
         print_success("已从 Gist 拉取密码本喵！")
         return True
     return False
@@ -372,35 +556,64 @@ def check_passwords():
         read_passwords()
 
 
+def _merge_with_gist(remote_dict, remote_ts_str, snapshot):
+    """
+    Three-way merges `snapshot` with the remote dictionary and uploads the result if needed.
+
+    Changes made locally while the upload ran are merged on top of the result again, so
+    nothing recorded in the meantime is lost. Returns False when the upload failed.
+    """
+    global pwdDictionary
+    base = _gist_sync_state.base if _gist_sync_state is not None else None
+    merged = merge_dictionaries(base, snapshot, remote_dict)
+    if merged != remote_dict:
+        if not _update_gist(_gist_cfg, json.dumps(merged, ensure_ascii=False, indent=4)):
+            return False
+        remote_ts_str = None
+    with _password_lock:
+        adopted = merge_dictionaries(snapshot, pwdDictionary, merged)
+        if adopted != pwdDictionary:
+            pwdDictionary = adopted
+    _mark_gist_synced(merged, remote_ts_str)
+    save_passwords()
+    return True
+
+
+def _push_passwords_to_gist():
+    """Merges the local dictionary into the Gist if it changed since the last sync."""
+    with _password_lock:
+        snapshot = dict(pwdDictionary)
+    if _gist_sync_state is not None and _gist_sync_state.is_synced(snapshot):
+        return True
+    remote_dict, remote_ts_str = _fetch_from_gist(_gist_cfg)
+    if remote_dict is None:
+        print_warning("拉取 Gist 密码本失败喵，未同步的改动会在下次继续合并上传。")
+        return False
+    if _merge_with_gist(remote_dict, remote_ts_str, snapshot):
+        print_success("已同步密码本到 Gist 喵！")
+        return True
+    print_warning("同步到 Gist 失败喵，请稍后重试！")
+    return False
+
+
 def _sync_to_gist_before_exit():
     global _gist_cfg, _gist_remote_ts, _skip_gist_sync
     if _gist_cfg is None or getattr(sys.modules['__main__'], '_skip_gist_sync', False) or globals().get('_skip_gist_sync'):
         return
-    pwdPath = os.path.join(DATA_DIR, pwdFilename)
-    if not os.path.exists(pwdPath):
+    if not os.path.exists(os.path.join(DATA_DIR, pwdFilename)):
         return
-    local_mtime = _dt.datetime.fromtimestamp(os.path.getmtime(pwdPath), tz=_dt.timezone.utc)
-    remote_dict, remote_ts_str = _fetch_from_gist(_gist_cfg)
-    if remote_ts_str:
-        remote_ts = _dt.datetime.fromisoformat(remote_ts_str.replace("Z", "+00:00"))
-    else:
-        remote_ts = None
-
-    if remote_ts and _gist_remote_ts and remote_ts > _gist_remote_ts and remote_ts > local_mtime:
-        print_warning("检测到远程密码本在本次会话期间发生更新，可能与本地冲突喵！")
-        print_warning(f"远程最后更新时间：{remote_ts.isoformat()} 本地最后更新时间：{local_mtime.isoformat()}")
-        # 冲突时依旧继续上传由用户自行决定，示例中选择继续
-
-    if _update_gist(_gist_cfg, json.dumps(pwdDictionary, ensure_ascii=False, indent=4)):
-        print_success("已同步密码本到 Gist 喵！")
-    else:
-        print_warning("同步到 Gist 失败喵，请稍后重试！")
-    time.sleep(1)
+    if _gist_worker is None:
+        _push_passwords_to_gist()
+        return
+    # 密码本未变化时后台任务不会访问网络，这里最多等待 GIST_EXIT_TIMEOUT 秒
+    _gist_worker.request_push()
+    if not _gist_worker.flush(GIST_EXIT_TIMEOUT):
+        print_warning("同步到 Gist 超时喵，未上传的改动会在下次退出时继续同步。")
 
 
 def _check_dict_conflict_on_startup():
-    """启动时检查本地密码本与 Gist 是否一致，冲突时让用户选择处理方式。"""
-    global _gist_cfg, _gist_remote_ts, pwdDictionary, _skip_gist_sync
+    """启动时检查本地密码本与 Gist 是否一致，不一致时自动三方合并。"""
+    global _gist_remote_ts
 
     if _gist_cfg is None:
         return
@@ -418,15 +631,11 @@ def _check_dict_conflict_on_startup():
     _gist_remote_ts = remote_ts
 
     if remote_dict == pwdDictionary:
+        _mark_gist_synced(remote_dict, remote_ts_str)
         print_info("启动检查完成：本地密码本与 Gist 一致喵。")
         return
 
-    pwd_path = os.path.join(DATA_DIR, pwdFilename)
-    local_mtime = (
-        _dt.datetime.fromtimestamp(os.path.getmtime(pwd_path), tz=_dt.timezone.utc)
-        if os.path.exists(pwd_path)
-        else None
-    )
+    local_mtime = _local_dict_mtime()
 
     print_warning("启动检查发现本地密码本与 Gist 不一致喵！")
     print_info(
@@ -436,56 +645,59 @@ def _check_dict_conflict_on_startup():
         f"远程最后修改时间：{remote_ts.astimezone().strftime('%Y-%m-%d %H:%M:%S') if remote_ts else '未知'}"
     )
 
-    while True:
-        console.print(
-            "[cyan][b]请选择冲突处理方式：[1] 拉取远程覆盖本地 [2] 上传本地覆盖远程 [3] 暂不处理且本次退出前不自动同步 [默认:1]：",
-            end="",
-        )
-        choice = input().strip()
+    # 以上次同步的内容为基准三方合并：保留双方新增的密码并累加双方的计数变化
+    if _merge_with_gist(remote_dict, remote_ts_str, dict(pwdDictionary)):
+        print_success("已自动合并本地与远程密码本喵！")
+    else:
+        print_warning("上传合并后的密码本失败喵，将保留本地内容继续运行，退出时会再次尝试合并。")
 
-        if choice in ("", "1"):
-            pwdDictionary = remote_dict
-            save_passwords()
-            print_success("已拉取远程密码本并覆盖本地喵！")
-            return
 
-        if choice == "2":
-            if _update_gist(_gist_cfg, json.dumps(pwdDictionary, ensure_ascii=False, indent=4)):
-                refreshed_dict, refreshed_ts_str = _fetch_from_gist(_gist_cfg)
-                if refreshed_dict is not None:
-                    _gist_remote_ts = (
-                        _dt.datetime.fromisoformat(refreshed_ts_str.replace("Z", "+00:00"))
-                        if refreshed_ts_str
-                        else _gist_remote_ts
-                    )
-                print_success("已上传本地密码本到 Gist 喵！")
-            else:
-                print_warning("上传本地密码本到 Gist 失败喵，将保留本地内容继续运行。")
-            return
-
-        if choice == "3":
-            _skip_gist_sync = True
-            print_info("本次会话将跳过退出时自动同步到 Gist。")
-            return
+def _fold_password_log_on_exit():
+    """Folds the change log into dict.json, after the Gist sync, so the file on disk is current."""
+    if _password_store is None:
+        return
+    try:
+        _password_store.flush(pwdDictionary, _password_lock, compact=True)
+    except Exception as e:
+        print_warning(f"退出时整理密码本失败喵，改动仍保留在变更日志中：{e}")
 
-        print_warning("输入无效喵，请输入 1、2 或 3。")
 
-# 注册到 atexit，以便任何正常退出路径都会尝试同步
+# 注册到 atexit，以便任何正常退出路径都会尝试同步；atexit 按注册的逆序执行，
+# 所以密码本在同步完成之后才合并日志
+atexit.register(_fold_password_log_on_exit)
 atexit.register(_sync_to_gist_before_exit)
 
-def add_password(pwd, count=1):
+_password_lock = threading.Lock()
+
+
+def add_password(pwd, count=1, file_path=None, level=None):
     if pwd == None:
         return
-    if pwd in pwdDictionary:
-        pwdDictionary[pwd] += count
-    else:
-        pwdDictionary[pwd] = count
+    with _password_lock:
+        old_count = pwdDictionary.get(pwd, 0)
+        if pwd in pwdDictionary:
+            pwdDictionary[pwd] += count
+        else:
+            pwdDictionary[pwd] = count
+        if _password_ranker is not None:
+            _password_ranker.record(pwd, old_count, file_path, level)
 
 
 import re
-import threading
 
 global_last_success_password = None
+_last_success_lock = threading.Lock()  # 并发任务共享上一次成功的密码
+
+
+def _fingerprint_archive(file_path, probe):
+    if _password_cache is None or not _password_cache.enabled:
+        return None
+    if probe.mode in ("none", "invalid"):
+        return None
+    try:
+        return compute_archive_fingerprint(file_path, probe.listing)
+    except OSError:
+        return None
 
 
 def try_remove_directory(dir):
@@ -494,6 +706,81 @@ def try_remove_directory(dir):
     except:
         pass
 
+
+def _predict_layer_shape(file_path, probe, password):
+    """
+    Predicts the layer's `LayerShape` from its listing before extracting it, or None.
+
+    Archives with encrypted headers are listed again once the password is known.
+    """
+    listing = probe.listing
+    if listing is None and probe.mode == "header" and password:
+        result, listing = list_archive_entries(file_path, password)
+        if result != 1:
+            return None
+    if listing is None:
+        return None
+    return predict_layer_shape(listing, SMALL_NON_ARCHIVE_IGNORE_THRESHOLD)
+
+
+def _layer_members(shape):
+    """Archive paths to extract from an intermediate layer, or None to extract everything."""
+    if not selective_nested_setting or shape is None or not shape.inner_members:
+        return None
+    return list(shape.inner_members)
+
+
+def _create_layer_folder(base_folder, shape, members):
+    """
+    Picks where one layer is extracted.
+
+    A layer predicted to hold only another archive (plus decoys) is an intermediate
+    step, so it goes to the stage (tmpfs by default) when the staging budget and free
+    space allow it. Final layers are extracted next
+    to the archive, on the destination device, so committing them is a rename.
+    Returns `(folder, reservation)`, where reservation is None for on-disk folders.
+    """
+    if stream_nested_setting and shape is not None and shape.inner is not None:
+        reservation = reserve_stage_folder(shape.inner_size if members else shape.total_size)
+        if reservation is not None:
+            return reservation.folder, reservation
+    return create_unique_directory(base_folder, "temp_extract"), None
+
+
+def _remove_layer_folder(folder, reservation):
+    try_remove_directory(folder)
+    if reservation is not None:
+        reservation.release()
+
+def _scan_layer_folder(folder, folder_name):
+    """
+    Scans an extracted layer, descending through single-directory wrappers.
+
+    Returns `(folder, folder_name, candidates)`, where candidates are the files worth
+    recursing into (split sets grouped, small decoys skipped).
+    """
+    try:
+        folder_index = get_directory_index(folder)
+        grouped_files = list(folder_index.primary_files())
+        # If the only item is a directory, go deeper.
+        while len(grouped_files) == 0 and len(folder_index.names) == 1:
+            only_item_name = next(iter(folder_index.names))
+            deeper_folder = os.path.join(folder, only_item_name)
+            if os.path.isdir(deeper_folder):
+                folder = deeper_folder
+                folder_name = os.path.basename(folder)
+                folder_index = get_directory_index(folder)
+                grouped_files = list(folder_index.primary_files())
+            else:
+                break  # Not a directory, stop digging
+    except FileNotFoundError:
+        # This can happen if extraction yields an empty folder that gets deleted.
+        return folder, folder_name, []
+
+    # 在判定是否继续递归时，忽略用于混淆的小体积“非压缩文件”喵
+    return folder, folder_name, recursion_candidates(folder_index, SMALL_NON_ARCHIVE_IGNORE_THRESHOLD)
+
+
 def recursive_extract(
     base_folder,
     file_path,
@@ -501,45 +788,129 @@ def recursive_extract(
     level=1,
     embedded_scan_depth=DEFAULT_EMBEDDED_SCAN_MAX_LEVEL,
     source_archive_paths: set = None,
+    outputs: list = None,
+    journal_entry=None,
+):
+    """
+    Recursively extracts archives, handling nested compressed files and passwords.
+
+    When `outputs` is given, the paths finally committed to `base_folder` are appended to it.
+    `journal_entry` records each layer's progress so an interrupted run can resume.
+    """
+    with trace_span("layer", layer=level, file=os.path.basename(file_path)):
+        return _extract_layer(
+            base_folder,
+            file_path,
+            last_success_password,
+            level,
+            embedded_scan_depth,
+            source_archive_paths,
+            outputs,
+            journal_entry or NULL_JOURNAL_ENTRY,
+        )
+
+
+def _extract_layer(
+    base_folder,
+    file_path,
+    last_success_password,
+    level,
+    embedded_scan_depth,
+    source_archive_paths,
+    outputs,
+    journal_entry,
 ):
-    """Recursively extracts archives, handling nested compressed files and passwords."""
     global global_last_success_password
     global extract_to_base_folder
     global auto_flatten_single_file
 
     source_archive_paths = set(source_archive_paths or [])
 
-    temp_folder = create_unique_directory(base_folder, "temp_extract")
-    orig_temp_folder = temp_folder  # 保存最初创建的临时目录路径
+    temp_folder = None  # 在第一次探测后创建，以便根据内容决定放在磁盘还是内存文件系统
+    orig_temp_folder = None  # 保存最初创建的临时目录路径
+    stage_reservation = None
     last_compressed_file_name = get_archive_base_name(file_path)
 
-    passwords = sorted(pwdDictionary.items(), key=lambda item: item[1], reverse=True)
+    passwords = _password_ranker.candidates(pwdDictionary, file_path, level)
+    rejected = journal_entry.rejected(level)
+    if rejected:
+        # 上次运行中已确认错误的密码不再尝试
+        passwords = [item for item in passwords if item[0] not in rejected]
     password = (
-        last_success_password if last_success_password is not None else passwords[0][0]
+        last_success_password
+        if last_success_password is not None or not passwords
+        else passwords[0][0]
     )
+    resumed_password = journal_entry.password_for(level)
+    if resumed_password is not None:
+        print_info(f"从上次中断处继续喵，沿用第 {level} 层已找到的密码。")
+        password = resumed_password
+    journal_entry.set_state("probing", level)
 
     while True:
-        tryResult = extract_with_7zip(file_path, temp_folder, password)
+        # 先用文件头 / 最小加密条目验证密码，确认后才真正解压
+        with trace_span("probe"):
+            probe = plan_password_probe(file_path)
+            fingerprint = _fingerprint_archive(file_path, probe)
+            cached = _password_cache.lookup(fingerprint) if fingerprint else None
+            if cached is not None and cached["password"] != password:
+                print_info(f"命中密码缓存喵（第 {cached['depth']} 层记录），优先尝试缓存中的密码。")
+                password = cached["password"]
+            verdict = verify_password(file_path, password, probe)
+        if verdict == -1:
+            journal_entry.reject(level, password)
+        elif verdict == 1:
+            journal_entry.record_password(level, password)
+        if temp_folder is None:
+            shape = _predict_layer_shape(file_path, probe, password if verdict >= 0 else None)
+            # 中间层只解压内层压缩包，用于混淆的小文件不落盘
+            members = _layer_members(shape)
+            temp_folder, stage_reservation = _create_layer_folder(base_folder, shape, members)
+            orig_temp_folder = temp_folder
+        if verdict < 0:
+            tryResult = verdict
+            if verdict == -2:
+                print_info(f"{file_path}\n可能不是压缩文件喵。")
+        else:
+            journal_entry.set_state("extracting", level)
+            tryResult = extract_with_7zip(file_path, temp_folder, password, members)
         if tryResult == -1:
-            # Try dictionary passwords first (excluding current)
-            next_password = try_passwords(
-                file_path, temp_folder, passwords, password
-            )
-            # Try archive name as a password fallback
-            if next_password is None:
-                name_pwd = last_compressed_file_name
-                if name_pwd and name_pwd != password:
-                    print_info(
-                        f"Trying archive name '{name_pwd}' as password..."
+            with trace_span("password", candidates=len(passwords)) as password_trace:
+                # Try dictionary passwords first (excluding current)
+                next_password = try_passwords(
+                    file_path,
+                    temp_folder,
+                    passwords,
+                    password,
+                    probe_jobs_setting,
+                    probe,
+                    members,
+                    on_rejected=lambda rejected_password: journal_entry.reject(level, rejected_password),
+                )
+                # Try archive name as a password fallback
+                if next_password is None:
+                    name_pwd = last_compressed_file_name
+                    if name_pwd and name_pwd != password:
+                        print_info(
+                            f"Trying archive name '{name_pwd}' as password..."
+                        )
+                        if (
+                            verify_password(file_path, name_pwd, probe) != -1
+                            and extract_with_7zip(file_path, temp_folder, name_pwd, members) > 0
+                        ):
+                            next_password = name_pwd
+                # Request manual entry if all automated attempts fail
+                if next_password is None:
+                    next_password = manual_password_entry(
+                        file_path, temp_folder, level, probe, members
                     )
-                    if extract_with_7zip(file_path, temp_folder, name_pwd) > 0:
-                        next_password = name_pwd
-            # Request manual entry if all automated attempts fail
-            if next_password is None:
-                next_password = manual_password_entry(file_path, temp_folder, level)
+                password_trace.finish(found=next_password is not None)
             if next_password is None:
+                _remove_layer_folder(orig_temp_folder, stage_reservation)
+                if daemon_mode_setting:
+                    print_warning(f"字典中没有能解开 {file_path} 的密码喵，已放入待输入密码队列。")
+                    return PasswordNeeded(file_path, level)
                 print_warning(f"用户跳过了文件 {file_path} 的密码输入喵，将跳过该文件。")
-                try_remove_directory(orig_temp_folder)
                 return True
             password = next_password
             break
@@ -554,7 +925,7 @@ def recursive_extract(
                 else:
                     # Bandizip也失败了，这个文件没救了
                     print_warning("Bandizip 也无法处理这个文件喵。")
-                    try_remove_directory(orig_temp_folder)
+                    _remove_layer_folder(orig_temp_folder, stage_reservation)
                     return True # 结束当前分支的解压
 
             # Search for embedded hidden archives if standard opening fails
@@ -568,63 +939,40 @@ def recursive_extract(
                     print_info(
                         f"Found embedded {fmt.upper() if fmt != '*' else 'file'}, extracting..."
                     )
-                    hiddenZip.extract_embedded_file(
-                        file_path, file_path + RECOVER_SUFFIX, fmt
-                    )
-                    file_path = file_path + RECOVER_SUFFIX
+                    recovered_path = file_path + RECOVER_SUFFIX
+                    if is_staged(file_path):
+                        # 暂存区的空间只按内层压缩包预留，恢复出的文件写到目标磁盘，
+                        # 与顶层的恢复文件一起在该目录的任务结束后清理
+                        recovered_path = os.path.join(
+                            base_folder,
+                            _pick_unique_name(base_folder, os.path.basename(recovered_path), False),
+                        )
+                    hiddenZip.extract_embedded_file(file_path, recovered_path, fmt)
+                    file_path = recovered_path
                     found_embedded = True
                     break
             
             if found_embedded:
+                members = None  # 恢复出的压缩包与之前的列表无关，完整解压
                 continue
 
             # 如果以上所有尝试都失败了
-            try_remove_directory(orig_temp_folder)
+            _remove_layer_folder(orig_temp_folder, stage_reservation)
             return True
         else:
             break
 
-    global_last_success_password = password
-    add_password(password)
+    with _last_success_lock:
+        global_last_success_password = password
+    if journal_entry.password_for(level) != password:
+        journal_entry.record_password(level, password)
+    add_password(password, file_path=file_path, level=level)
+    if fingerprint and _password_cache is not None:
+        _password_cache.remember(fingerprint, password, level)
 
-    # Scan the temporary folder for files and group multi-volume archives
-    try:
-        grouped_files = group_archive_files(temp_folder)
-        # If the only item is a directory, go deeper.
-        while len(grouped_files) == 0 and len(os.listdir(temp_folder)) == 1:
-            only_item_name = os.listdir(temp_folder)[0]
-            deeper_folder = os.path.join(temp_folder, only_item_name)
-            if os.path.isdir(deeper_folder):
-                temp_folder = deeper_folder
-                last_compressed_file_name = os.path.basename(temp_folder)
-                grouped_files = group_archive_files(temp_folder)
-            else:
-                break  # Not a directory, stop digging
-    except FileNotFoundError:
-        # This can happen if extraction yields an empty folder that gets deleted.
-        grouped_files = []
-
-    # 在判定是否继续递归时，忽略用于混淆的小体积“非压缩文件”喵
-    filtered_grouped_files = []
-    for fname in grouped_files:
-        full_path = os.path.join(temp_folder, fname)
-        if not os.path.isfile(full_path):
-            continue
-
-        # 只对“看起来不像压缩包”的文件做体积阈值过滤
-        if not is_likely_archive_filename(fname):
-            try:
-                size = os.path.getsize(full_path)
-            except OSError:
-                size = SMALL_NON_ARCHIVE_IGNORE_THRESHOLD + 1
-
-            if size <= SMALL_NON_ARCHIVE_IGNORE_THRESHOLD:
-                # 这是一个小体积的非压缩文件，用于混淆时可以直接忽略喵
-                continue
-
-        filtered_grouped_files.append(fname)
-
-    grouped_files = filtered_grouped_files
+    temp_folder, last_compressed_file_name, grouped_files = _scan_layer_folder(
+        temp_folder, last_compressed_file_name
+    )
 
     finished = False
     if len(grouped_files) == 1:
@@ -636,7 +984,13 @@ def recursive_extract(
             level + 1,
             embedded_scan_depth=embedded_scan_depth,
             source_archive_paths=source_archive_paths,
+            outputs=outputs,
+            journal_entry=journal_entry,
         )
+        if isinstance(finished, PasswordNeeded):
+            # 内层还缺密码：本层不提交，整个输入等拿到密码后重新处理
+            _remove_layer_folder(orig_temp_folder, stage_reservation)
+            return finished
         if not finished:
             try:
                 os.remove(new_file_path)
@@ -645,6 +999,23 @@ def recursive_extract(
     else:
         finished = True
 
+    if finished and members:
+        # 本层最终没有递归成功，需要完整输出：补全之前跳过的其余文件
+        with trace_span("selective_fallback"):
+            if stage_reservation is not None and not stage_reservation.grow(shape.total_size):
+                # 完整的一层放不进暂存区，改为在目标磁盘上重新完整解压
+                _remove_layer_folder(orig_temp_folder, stage_reservation)
+                stage_reservation = None
+                orig_temp_folder = create_unique_directory(base_folder, "temp_extract")
+            fallback_result = extract_with_7zip(file_path, orig_temp_folder, password)
+        if fallback_result <= 0:
+            print_warning(f"补全 {file_path} 的其余文件失败喵，将跳过该文件。")
+            _remove_layer_folder(orig_temp_folder, stage_reservation)
+            return True
+        temp_folder, last_compressed_file_name, _ = _scan_layer_folder(
+            orig_temp_folder, get_archive_base_name(file_path)
+        )
+
     if finished:
         allow_replace_reserved = bool(
             source_archive_paths
@@ -671,6 +1042,8 @@ def recursive_extract(
                     reserved_paths=source_archive_paths,
                     allow_replace_reserved=allow_replace_reserved,
                 )
+                if outputs is not None:
+                    outputs.append(flattened_output_path)
                 print_success(
                     f"检测到 {last_compressed_file_name}/"
                     f"{os.path.basename(flattened_output_path)} 结构喵，"
@@ -687,13 +1060,16 @@ def recursive_extract(
 
             if extract_to_base_folder or flatten_due_to_prefix:
                 target_folder = base_folder
-                for entry in temp_entries:
-                    move_path_with_collision_handling(
-                        os.path.join(temp_folder, entry),
+                with trace_span("move", entries=len(temp_entries)):
+                    committed_paths = commit_entries(
+                        temp_folder,
+                        temp_entries,
                         target_folder,
                         reserved_paths=source_archive_paths,
                         allow_replace_reserved=allow_replace_reserved,
                     )
+                if outputs is not None:
+                    outputs.extend(committed_paths)
 
                 if flatten_due_to_prefix and not extract_to_base_folder:
                     print_success(
@@ -722,8 +1098,8 @@ def recursive_extract(
                         base_folder, last_compressed_file_name
                     )
 
-                for entry in temp_entries:
-                    shutil.move(os.path.join(temp_folder, entry), target_folder)
+                with trace_span("move", entries=len(temp_entries)):
+                    commit_entries(temp_folder, temp_entries, target_folder)
 
                 if needs_reserved_replacement:
                     final_target_folder = target_folder
@@ -743,93 +1119,424 @@ def recursive_extract(
                             final_target_folder = target_folder
                     target_folder = final_target_folder
 
+                if outputs is not None:
+                    outputs.append(target_folder)
                 print_success(f"最终文件被移动到：{target_folder}")
 
-    try_remove_directory(orig_temp_folder)
+    _remove_layer_folder(orig_temp_folder, stage_reservation)
     return False
 
 
-SERVER_PORT = 65432
-
-from multiprocessing import Process, Manager
-import time
 from filelock import FileLock, Timeout
 
-# Function to send file path to the main instance
-queue_file_path = append_scr_path("queue_file.txt")
-queue_file_lock = append_scr_path("queue_file.lock")
+# 主实例监听的本地端点（端口与认证密钥），由后续启动的实例读取
+ipc_endpoint_path = append_scr_path("ipc_endpoint.json")
 instance_lock = append_scr_path("instance.lock")
 
 
-def send_file_to_main_instance(file_paths):
-    print(str(file_paths))
-    lock = FileLock(queue_file_lock)
-    with lock.acquire(timeout=-1):
-        with open(queue_file_path, "a", encoding="utf-8") as f:
-            for file in file_paths:
-                f.write(file + "\n")
-
-
-class FileManager:
-    def __init__(self, queue_path, lock_path):
-        self.queue_path = queue_path
-        self.lock_path = lock_path
-        manager = Manager()
-        self.files_to_process = manager.list()
-        self.process = Process(target=self.queue_listener)
-        self.process.start()
-
-    def queue_listener(self):
-        while True:
-            lock = FileLock(self.lock_path)
-            if os.path.exists(self.queue_path):
-                with lock.acquire(timeout=0):
-                    with open(self.queue_path, "r", encoding="utf-8") as f:
-                        lines = f.readlines()
-                    if lines:
-                        os.remove(self.queue_path)
-                        for line in lines:
-                            self.files_to_process.append(line.strip())
-            time.sleep(0.1)
-
-    def stop(self):
-        self.process.terminate()
-
-    def __del__(self):
-        self.stop()
+# 并发解压时按目录记录状态：残留临时文件夹只在首次进入目录时清理，
+# .AutoDecRecovered 文件等到该目录最后一个任务结束后再统一移除
+_base_folder_lock = threading.Lock()
+_cleaned_base_folders = set()
+_active_base_folders = {}
+
+
+def _enter_base_folder(base_folder):
+    key = _normalize_path_for_compare(base_folder or ".")
+    with _base_folder_lock:
+        _active_base_folders[key] = _active_base_folders.get(key, 0) + 1
+        if key in _cleaned_base_folders:
+            return
+        _cleaned_base_folders.add(key)
+        if move_temp_folders_to_recycle_bin(base_folder):
+            print_info(
+                "检测到上一次非正常退出留下的临时文件夹喵！已经把它们全部移动到回收站了喵☆"
+            )
+
+
+def _leave_base_folder(base_folder):
+    key = _normalize_path_for_compare(base_folder or ".")
+    with _base_folder_lock:
+        _active_base_folders[key] -= 1
+        if _active_base_folders[key] > 0:
+            return
+        del _active_base_folders[key]
+    remove_autodec_files(base_folder)
+
+
+def process_input_file(file_path):
+    """Extracts one top-level input and trashes the source archive on success."""
+    if file_path.lower().endswith(".apk"):
+        print_info(f"跳过 .apk 文件：{file_path} 喵。")
+        return
+    print_info(f"开始解压文件 {file_path} 喵❤")
+    base_folder = os.path.dirname(file_path)
+    _enter_base_folder(base_folder)
+    try:
+        _extract_input_file(file_path, base_folder)
+    finally:
+        _leave_base_folder(base_folder)
+
+
+def _extract_input_file(file_path, base_folder):
+
+    try:
+        source_archive_paths = {
+            _normalize_path_for_compare(p)
+            for p in list_related_archive_parts(file_path)
+        }
+    except Exception:
+        source_archive_paths = {_normalize_path_for_compare(file_path)}
+
+    journal_entry = _batch_journal.entry(file_path) if _batch_journal is not None else None
+    outputs = []
+    with _last_success_lock:
+        last_success_password = global_last_success_password
+    _ret = recursive_extract(
+        base_folder,
+        file_path,
+        last_success_password,
+        embedded_scan_depth=embedded_scan_depth_setting,
+        source_archive_paths=source_archive_paths,
+        outputs=outputs,
+        journal_entry=journal_entry,
+    )
+    if _ret is False and journal_entry is not None:
+        journal_entry.commit(outputs)
+    if isinstance(_ret, PasswordNeeded) and _password_requests is not None:
+        request_id = _password_requests.park(file_path, _ret)
+        print_info(
+            f"待输入密码 #{request_id}：{file_path}（第 {_ret.level} 层）。"
+            f"可运行 `--answer-password {request_id} 密码` 提供密码喵。"
+        )
+    if _input_deduplicator is not None:
+        # 回收站移动推迟到批次结束：重复的压缩包要先与原件逐字节比较
+        _input_deduplicator.record_result(file_path, outputs if _ret is False else None)
+    # 解压成功才执行回收站移动；失败（非密码错误导致）则不移动
+    elif _ret is False:
+        _trash_source_archive(file_path, outputs)
+
+
+def _trash_source_archive(file_path, outputs):
+    if not (hasattr(CLI_ARGS, "trash_on_success") and CLI_ARGS.trash_on_success):
+        return
+    # 输出替换了同名的源压缩包时，这个路径现在指向该输入自己的解压结果
+    output_paths = {_normalize_path_for_compare(p) for p in outputs}
+    try:
+        for p in list_related_archive_parts(file_path):
+            if _normalize_path_for_compare(p) in output_paths:
+                # This path now points to extracted output after a reserved-name replacement.
+                continue
+            if os.path.exists(p):
+                with trace_span("trash", file=os.path.basename(p)):
+                    send2trash.send2trash(p)
+                print_info(f"已将被解压的原始压缩文件移动到回收站：{p}")
+    except Exception as e:
+        print_warning(f"移动原始压缩文件到回收站失败喵：{e}")
+
+
+def _filter_inputs(file_paths):
+    """
+    Redirects split members to their primary part, drops inputs an earlier run already
+    finished, and holds back duplicate archives.
+    """
+    file_paths = filter_non_primary_split_inputs(file_paths)
+    unique_paths = []
+    for file_path in file_paths:
+        if _batch_journal is not None:
+            if _batch_journal.committed_outputs(file_path) is not None:
+                print_info(f"{file_path} 已在之前的运行中解压完成且输出仍在喵，跳过。")
+                continue
+            _batch_journal.entry(file_path).set_state("queued")
+        if _input_deduplicator is not None and _input_deduplicator.add(file_path):
+            print_info(f"{file_path} 与本批次中的另一个压缩包指纹相同喵，等它解压完成后核对内容。")
+            continue
+        unique_paths.append(file_path)
+    return unique_paths
+
+
+def _settle_duplicates():
+    """
+    Gives every held-back duplicate the outputs of its original, or reports it, then
+    trashes the successfully extracted inputs. Returns the held-back inputs whose bytes
+    turned out to differ from their original; they still need their own extraction.
+    """
+    if _input_deduplicator is None:
+        return []
+    duplicates, succeeded = _input_deduplicator.take_batch()
+    mismatched = []
+    for duplicate, original, outputs in duplicates:
+        # 原件此时已解压完毕且尚未移入回收站，在锁外逐字节确认
+        if not same_content(duplicate, original):
+            print_info(f"{duplicate} 与 {original} 指纹相同但内容不同喵，重新排队单独解压。")
+            mismatched.append(duplicate)
+            continue
+        parked = _password_requests.find(original) if outputs is None and _password_requests else None
+        if parked is not None:
+            request_id = _password_requests.park(
+                duplicate, PasswordNeeded(parked["layer_file"], parked["layer"]), duplicate_of=original
+            )
+            print_info(
+                f"{duplicate} 与等待密码的 {original}（#{parked['id']}）内容相同喵，"
+                f"一起等待密码（#{request_id}），提供 #{parked['id']} 的密码时会一并重新解压。"
+            )
+            continue
+        if outputs is None:
+            print_warning(f"跳过重复的压缩包 {duplicate} 喵：与之相同的 {original} 未能成功解压。")
+            continue
+        if dedup_mode_setting == "skip":
+            print_info(f"跳过重复的压缩包 {duplicate} 喵（与 {original} 相同，未复制解压结果）。")
+            continue
+        try:
+            with trace_span("dedup", file=os.path.basename(duplicate)):
+                created = replicate_outputs(
+                    outputs, original, duplicate, link=dedup_mode_setting == "link"
+                )
+        except Exception as e:
+            print_warning(f"为重复的压缩包 {duplicate} 复制解压结果失败喵：{e}")
+            continue
+        print_success(
+            f"{duplicate} 与 {original} 内容相同喵，已直接复用解压结果："
+            + ("、".join(created) if created else "（无输出）")
+        )
+        if _batch_journal is not None:
+            _batch_journal.entry(duplicate).commit(created)
+        _trash_source_archive(duplicate, created)
+    for original, outputs in succeeded.items():
+        _trash_source_archive(original, outputs)
+    return mismatched
+
+
+def _finish_batch():
+    """Settles the batch and saves state; returns inputs that must be queued again."""
+    requeue = _settle_duplicates()
+    save_passwords()  # 保存到本地
+    if _gist_worker is not None:
+        _gist_worker.request_push()  # 后台上传，不阻塞下一批任务
+    _password_cache.save()
+    return requeue
+
+
+def _run_batches(files_to_process, manager, max_jobs, max_jobs_per_device,
+                 process=process_input_file):
+    if max_jobs > 1:
+        _run_concurrent_batches(files_to_process, manager, max_jobs, max_jobs_per_device, process)
+    else:
+        _run_sequential_batches(files_to_process, manager, process)
+
+
+def _run_sequential_batches(files_to_process, manager, process=process_input_file):
+    """Extracts inputs one at a time, appending files pushed by other instances to the queue."""
+    while files_to_process:
+        process(files_to_process.popleft())
+        # 其他实例推送的新文件会立即排到当前队列末尾
+        incoming = manager.take_pending()
+        if not files_to_process:
+            incoming.extend(_finish_batch())
+            incoming.extend(manager.take_pending())
+        if incoming:
+            files_to_process.extend(_filter_inputs(incoming))
+
+
+def _run_concurrent_batches(files_to_process, manager, max_jobs, max_jobs_per_device,
+                            process=process_input_file):
+    """Runs independent top-level archives through the scheduler under one shared progress display."""
+    scheduler = ExtractionScheduler(process, max_jobs, max_jobs_per_device)
+    progress = create_shared_progress()
+    set_shared_progress(progress)
+    try:
+        with progress:
+            while files_to_process:
+                for file_path in files_to_process:
+                    scheduler.submit(file_path)
+                files_to_process.clear()
+                # 任务运行期间阻塞等待其他实例推送的新文件，收到后立即调度
+                while scheduler.busy():
+                    incoming = manager.take_pending(timeout=0.5)
+                    if incoming:
+                        files_to_process.extend(_filter_inputs(incoming))
+                        break
+                if not files_to_process:
+                    requeue = _finish_batch()
+                    files_to_process.extend(
+                        _filter_inputs(requeue + manager.take_pending())
+                    )
+    finally:
+        set_shared_progress(None)
+
+
+def _process_input_isolated(file_path):
+    """`process_input_file` for the daemon: one broken input must not stop the service."""
+    try:
+        process_input_file(file_path)
+    except Exception:
+        print_error(f"处理 {file_path} 时出错喵，已跳过该文件：\n{traceback.format_exc()}")
+
+
+def _run_daemon(files_to_process, manager, max_jobs, max_jobs_per_device):
+    """Serves pushed files until the process is stopped, never waiting for console input."""
+    print_info("守护进程模式已启动喵，等待其他实例推送文件（Ctrl+C 退出）...")
+    while True:
+        if files_to_process:
+            _run_batches(
+                files_to_process, manager, max_jobs, max_jobs_per_device, _process_input_isolated
+            )
+        files_to_process.extend(_filter_inputs(manager.take_pending(timeout=DAEMON_POLL_INTERVAL)))
+
+
+def _register_password_request_handlers(manager):
+    """Serves the needs-password queue to other instances over the IPC channel."""
+
+    def list_requests(message):
+        return {"ok": True, "requests": _password_requests.list()}
+
+    def answer_request(message):
+        request = _password_requests.take(int(message["id"]))
+        if request is None:
+            return {"ok": False, "error": f"没有编号为 {message['id']} 的待输入密码请求"}
+        # 与它内容相同、一起等待密码的压缩包也重新排队，去重会让它们复用这次的解压结果
+        requests = [request] + _password_requests.take_duplicates_of(request["file"])
+        password = message["password"]
+        add_password(password, 0)
+        save_passwords()
+        if _batch_journal is not None:
+            # 重新解压时该层直接使用这个密码
+            for parked in requests:
+                _batch_journal.entry(parked["file"]).record_password(parked["layer"], password)
+        if not manager.enqueue(*(parked["file"] for parked in requests)):
+            _password_requests.restore(requests)
+            return {"ok": False, "error": "主实例正在退出，密码已保存，请求仍保留在队列中"}
+        print_info(
+            f"收到待输入密码 #{request['id']} 的密码喵，"
+            + "、".join(parked["file"] for parked in requests)
+            + " 已重新排队。"
+        )
+        return {"ok": True, "file": request["file"]}
+
+    manager.register("list_password_requests", list_requests)
+    manager.register("answer_password", answer_request)
+
+
+def _print_password_requests(requests_list):
+    if not requests_list:
+        print_info("当前没有等待输入密码的压缩包喵。")
+        return
+    table = Table(title="等待输入密码的压缩包喵")
+    table.add_column("ID", justify="right")
+    table.add_column("文件")
+    table.add_column("层级", justify="right")
+    table.add_column("需要密码的文件")
+    table.add_column("等待自", style="magenta")
+    for request in requests_list:
+        table.add_row(
+            str(request["id"]),
+            request["file"]
+            + (f"\n（与 {request['duplicate_of']} 相同）" if request.get("duplicate_of") else ""),
+            str(request["layer"]),
+            request["layer_file"],
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(request["since"])),
+        )
+    console.print(table)
+
+
+def _send_password_request_command(args):
+    """Runs --password-requests / --answer-password against the running instance."""
+    if args.password_requests:
+        reply = send_request(ipc_endpoint_path, {"cmd": "list_password_requests"})
+        if not reply or not reply.get("ok"):
+            print_error("无法从正在运行的实例获取待输入密码队列喵。")
+            return False
+        _print_password_requests(reply["requests"])
+    if args.answer_password:
+        request_id, password = args.answer_password
+        if not request_id.isdigit():
+            print_error(f"待输入密码请求编号应为数字喵：{request_id}")
+            return False
+        reply = send_request(
+            ipc_endpoint_path, {"cmd": "answer_password", "id": int(request_id), "password": password}
+        )
+        if not reply or not reply.get("ok"):
+            print_error(f"提供密码失败喵：{(reply or {}).get('error', '无法连接到正在运行的实例')}")
+            return False
+        print_success(f"已提供密码喵，{reply['file']} 已重新排队解压。")
+    return True
 
 
 def main(args):
-    global extract_to_base_folder, _gist_cfg, _gist_remote_ts, embedded_scan_depth_setting, auto_flatten_single_file, _skip_gist_sync
+    global extract_to_base_folder, _gist_cfg, _gist_sync_state, _gist_worker, _gist_remote_ts, embedded_scan_depth_setting, auto_flatten_single_file, _skip_gist_sync, probe_jobs_setting, _password_cache, _password_ranker, stream_nested_setting, selective_nested_setting, dedup_mode_setting, _input_deduplicator, _batch_journal, daemon_mode_setting, _password_requests
+
+    # 尽早开始监听，让之后启动的实例可以立即推送文件
+    manager = FileManager(ipc_endpoint_path)
+    daemon_mode_setting = args.daemon
+    extraction.HEADLESS = daemon_mode_setting
+    _password_requests = PasswordRequestQueue(os.path.join(DATA_DIR, PASSWORD_REQUESTS_FILENAME))
+    _register_password_request_handlers(manager)
 
+    if args.trace:
+        trace_path = start_tracing(os.path.join(DATA_DIR, "traces"))
+        print_info(f"已启用耗时追踪喵，记录将写入：{trace_path}")
+
+    _gist_sync_state = GistSyncState(os.path.join(DATA_DIR, GIST_SYNC_STATE_FILENAME))
     _gist_cfg = _ensure_gist_config()
 
     if getattr(args, "update_dict", False):
-        if _pull_from_gist_if_possible():
+        updated = _pull_from_gist_if_possible()
+        if updated:
             _skip_gist_sync = True
-            import sys
-            sys.exit(0)
         else:
             print_error("强制拉取密码本失败喵。")
-            import sys
-            sys.exit(1)
+        manager.stop()
+        stop_tracing()
+        sys.exit(0 if updated else 1)
 
     check_passwords()
+    _password_ranker = PasswordRanker(os.path.join(DATA_DIR, PWD_STATS_FILENAME))
+    _password_cache = PasswordCache(
+        os.path.join(DATA_DIR, PWD_CACHE_FILENAME), args.password_cache_size
+    )
 
     if getattr(args, "check_dict_conflict_on_startup", False):
         _check_dict_conflict_on_startup()
-
-    manager = FileManager(queue_file_path, queue_file_lock)
+    if _gist_cfg is not None and not _skip_gist_sync:
+        _gist_worker = GistSyncWorker(_push_passwords_to_gist)
 
     embedded_scan_depth_setting = max(0, args.embedded_scan_depth)
     auto_flatten_single_file = args.flatten_single_file
+    probe_jobs_setting = max(1, args.probe_jobs)
+    stream_nested_setting = args.stream_nested
+    selective_nested_setting = args.selective_nested
+    dedup_mode_setting = args.dedup_inputs
+    if args.resume:
+        _batch_journal = BatchJournal(os.path.join(DATA_DIR, BATCH_JOURNAL_FILENAME))
+    if dedup_mode_setting != "off":
+        _input_deduplicator = InputDeduplicator()
+    max_jobs = max(1, args.jobs)
     hiddenZip.USE_BINWALK = bool(args.use_binwalk)
+    hiddenZip.SCAN_STRATEGY = args.embedded_scan_window
     if not auto_flatten_single_file:
         print_info("已禁用同名单文件自动扁平化喵。")
+    configure_staging(args.staging_dir, args.staging_budget)
+    if not stream_nested_setting:
+        print_info("已禁用中间层内存暂存，每一层都会解压到磁盘喵。")
+    elif args.staging_dir:
+        if os.path.isdir(args.staging_dir):
+            print_info(f"中间层将暂存到 {args.staging_dir} 喵。")
+        else:
+            print_warning(f"暂存目录 {args.staging_dir} 不存在喵，中间层将直接解压到目标磁盘。")
     if hiddenZip.USE_BINWALK:
         print_info("已启用 binwalk 进行隐藏嵌入文件判定喵。")
+    elif hiddenZip.SCAN_STRATEGY != "full":
+        print_info(f"隐藏嵌入文件签名搜索将使用 {hiddenZip.SCAN_STRATEGY} 窗口喵。")
     if args.embedded_scan_depth < 0:
         print_warning("嵌入检测层级小于 0 喵，已自动调整为 0（禁用嵌入扫描）。")
+    if args.probe_jobs < 1:
+        print_warning("密码探测并发数小于 1 喵，已自动调整为 1。")
+    elif probe_jobs_setting > 1:
+        print_info(f"已启用 {probe_jobs_setting} 路并发密码探测喵。")
+    if max_jobs > 1:
+        print_info(
+            f"已启用并发解压喵：最多 {max_jobs} 个任务，每个磁盘设备最多 {max(1, args.jobs_per_device)} 个。"
+        )
     if embedded_scan_depth_setting == 0:
         print_info("当前已禁用隐藏嵌入文件判定喵。")
     elif embedded_scan_depth_setting != DEFAULT_EMBEDDED_SCAN_MAX_LEVEL:
@@ -837,80 +1544,45 @@ def main(args):
             f"隐藏嵌入文件判定最大层级已调整为 {embedded_scan_depth_setting} 层喵。"
         )
 
-    files_to_process = list(args.files)
-
     try:
-        if len(files_to_process) > 0:
-            while True:
-                current_batch = files_to_process[:]
-                files_to_process = []
-                current_batch = filter_non_primary_split_inputs(current_batch)
-                for file_path in current_batch:
-                    if file_path.lower().endswith(".apk"):
-                        print_info(f"跳过 .apk 文件：{file_path} 喵。")
-                        continue
-                    print_info(f"开始解压文件 {file_path} 喵❤")
-                    _RECYCLED_RESERVED_PATHS.clear()
-                    base_folder = os.path.dirname(file_path)
-                    if move_temp_folders_to_recycle_bin(base_folder):
-                        print_info(
-                            "检测到上一次非正常退出留下的临时文件夹喵！已经把它们全部移动到回收站了喵☆"
-                        )
-
-                    try:
-                        source_archive_paths = {
-                            _normalize_path_for_compare(p)
-                            for p in list_related_archive_parts(file_path)
-                        }
-                    except Exception:
-                        source_archive_paths = {_normalize_path_for_compare(file_path)}
-
-                    _ret = recursive_extract(
-                        base_folder,
-                        file_path,
-                        global_last_success_password,
-                        embedded_scan_depth=embedded_scan_depth_setting,
-                        source_archive_paths=source_archive_paths,
-                    )
-                    # 解压成功才执行回收站移动；失败（非密码错误导致）则不移动
-                    if _ret is False and hasattr(CLI_ARGS, "trash_on_success") and CLI_ARGS.trash_on_success:
-                        try:
-                            for p in list_related_archive_parts(file_path):
-                                if _normalize_path_for_compare(p) in _RECYCLED_RESERVED_PATHS:
-                                    # This path now points to extracted output after a reserved-name replacement.
-                                    continue
-                                if os.path.exists(p):
-                                    send2trash.send2trash(p)
-                                    print_info(f"已将被解压的原始压缩文件移动到回收站：{p}")
-                        except Exception as e:
-                            print_warning(f"移动原始压缩文件到回收站失败喵：{e}")
-                    remove_autodec_files(base_folder)
-                save_passwords()  # 保存到本地
-                if not manager.files_to_process:
-                    break
-                files_to_process.extend(manager.files_to_process)
-                manager.files_to_process[:] = []  # 使用切片赋值清空列表
-            print_info("解压完成，退出程序喵...")
+        files_to_process = deque(_filter_inputs(list(args.files)))
+        if daemon_mode_setting:
+            _run_daemon(files_to_process, manager, max_jobs, args.jobs_per_device)
         else:
-            print_warning("请拖拽一个文件到这个脚本上进行解压喵！")
-            print_info("也可以输入想要添加的密码喵：")
-            while True:
-                pwd = input()
-                if pwd != "":
-                    add_password(pwd, 0)
-                    save_passwords()
-                    print_info(f"已添加密码 {pwd} 喵！")
-                else:
-                    break
+            extracted = len(files_to_process) > 0
+            if extracted:
+                _run_batches(files_to_process, manager, max_jobs, args.jobs_per_device)
+            else:
+                print_warning("请拖拽一个文件到这个脚本上进行解压喵！")
+                print_info("也可以输入想要添加的密码喵：")
+                while True:
+                    pwd = input()
+                    if pwd != "":
+                        add_password(pwd, 0)
+                        save_passwords()
+                        print_info(f"已添加密码 {pwd} 喵！")
+                    else:
+                        break
+            # 停止接收新文件，再处理已经向其他实例确认接收、但还没取出的文件
+            files_to_process.extend(_filter_inputs(manager.close()))
+            if files_to_process:
+                extracted = True
+                _run_batches(files_to_process, manager, max_jobs, args.jobs_per_device)
+            if extracted:
+                print_info("解压完成，退出程序喵...")
     except Exception as e:
         error_end(e)
+    finally:
+        manager.stop()
+        stop_tracing()
 
 
 def error_end(e: Exception = None):
     print_error(
         f"程序出现错误喵>.< 非常抱歉喵，下面是错误信息喵！\n{traceback.format_exc()}"
     )
-    input()
+    if not daemon_mode_setting:
+        input()
 
 
 if __name__ == "__main__":
@@ -919,8 +1591,7 @@ if __name__ == "__main__":
     if CLI_ARGS.config_dir:
         CONFIG_DIR = os.path.abspath(CLI_ARGS.config_dir)
         # 更新依赖 CONFIG_DIR 的全局路径变量
-        queue_file_path = append_scr_path("queue_file.txt")
-        queue_file_lock = append_scr_path("queue_file.lock")
+        ipc_endpoint_path = append_scr_path("ipc_endpoint.json")
         instance_lock = append_scr_path("instance.lock")
 
     _ensure_directory(CONFIG_DIR, "配置")
@@ -934,24 +1605,48 @@ if __name__ == "__main__":
     try:
         lock = FileLock(instance_lock)
         with lock.acquire(timeout=0):
+            if CLI_ARGS.password_requests or CLI_ARGS.answer_password:
+                print_warning("当前没有正在运行的实例喵，没有可以查询或回复的待输入密码请求。")
+                sys.exit(1)
             try:
                 main(CLI_ARGS)
                 time.sleep(1)
             except Exception as e:
                 error_end(e)
     except Timeout:
+        if CLI_ARGS.password_requests or CLI_ARGS.answer_password:
+            sys.exit(0 if _send_password_request_command(CLI_ARGS) else 1)
+        if CLI_ARGS.daemon:
+            print_warning("已有实例正在运行，--daemon 参数未被应用喵，文件已交给正在运行的实例处理。")
+        queued = True
         if CLI_ARGS.files:
             # Try to send file paths to the existing instance
-            send_file_to_main_instance(CLI_ARGS.files)
+            queued = send_file_to_main_instance(ipc_endpoint_path, CLI_ARGS.files)
         if CLI_ARGS.embedded_scan_depth != DEFAULT_EMBEDDED_SCAN_MAX_LEVEL:
             print_warning(
                 "已有实例正在运行，新的嵌入扫描层级参数未被应用喵。请先关闭原实例再重新运行。"
             )
+        if CLI_ARGS.probe_jobs != DEFAULT_PROBE_JOBS:
+            print_warning(
+                "已有实例正在运行，新的 --probe-jobs 参数未被应用喵。请先关闭原实例再重新运行。"
+            )
+        if CLI_ARGS.jobs != DEFAULT_MAX_JOBS or CLI_ARGS.jobs_per_device != DEFAULT_MAX_JOBS_PER_DEVICE:
+            print_warning(
+                "已有实例正在运行，新的并发解压参数未被应用喵。请先关闭原实例再重新运行。"
+            )
+        if CLI_ARGS.password_cache_size != DEFAULT_CACHE_CAPACITY:
+            print_warning(
+                "已有实例正在运行，新的 --password-cache-size 参数未被应用喵。请先关闭原实例再重新运行。"
+            )
+        if CLI_ARGS.trace:
+            print_warning(
+                "已有实例正在运行，--trace 参数未被应用喵。请先关闭原实例并带上 --trace 重新运行。"
+            )
         if CLI_ARGS.use_binwalk:
             print_warning(
                 "已有实例正在运行，新的 --use-binwalk 参数未被应用喵。请先关闭原实例再重新运行。"
             )
-        print_info("检测到已经有一个实例在运行，已将任务添加到队列中喵！")
-        pass
+        if queued:
+            print_info("检测到已经有一个实例在运行，已将任务添加到队列中喵！")
     except Exception:
         error_end()
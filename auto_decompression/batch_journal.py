@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+
+from housekeeping import _normalize_path_for_compare, print_warning
+
+JOURNAL_COMPACT_LINES = 5000  # Journal lines after which it is rewritten with one line per input
+JOURNAL_RETENTION_DAYS = 30  # Inputs untouched for longer are forgotten on compaction
+
+def input_key(file_path):
+    """Identifies an input by path, size and mtime, so a replaced file starts over."""
+    st = os.stat(file_path)
+    return f"{_normalize_path_for_compare(os.path.abspath(file_path))}|{st.st_size}|{st.st_mtime_ns}"
+
+
+class _NullJournalEntry:
+    """Used while the journal is disabled; records nothing and knows nothing."""
+
+    def set_state(self, state, layer=None):
+        pass
+
+    def record_password(self, layer, password):
+        pass
+
+    def reject(self, layer, password):
+        pass
+
+    def password_for(self, layer):
+        return None
+
+    def rejected(self, layer):
+        return frozenset()
+
+    def commit(self, outputs):
+        pass
+
+
+NULL_JOURNAL_ENTRY = _NullJournalEntry()
+
+
+class JournalEntry:
+    """The journal record of one top-level input."""
+
+    def __init__(self, journal, key):
+        self.journal = journal
+        self.key = key
+
+    def set_state(self, state, layer=None):
+        self.journal._append({"k": self.key, "state": state, "layer": layer}, sync=True)
+
+    def record_password(self, layer, password):
+        self.journal._append({"k": self.key, "layer": layer, "password": password}, sync=True)
+
+    def reject(self, layer, password):
+        # 被拒绝的候选密码很多，只刷新到系统缓冲区：进程被杀时不会丢，断电时最多重试几个
+        self.journal._append({"k": self.key, "layer": layer, "rejected": password}, sync=False)
+
+    def password_for(self, layer):
+        with self.journal._lock:
+            record = self.journal.inputs.get(self.key)
+            return record["passwords"].get(str(layer)) if record else None
+
+    def rejected(self, layer):
+        with self.journal._lock:
+            record = self.journal.inputs.get(self.key)
+            return frozenset(record["rejected"].get(str(layer), ())) if record else frozenset()
+
+    def commit(self, outputs):
+        self.journal._append(
+            {"k": self.key, "state": "committed", "outputs": list(outputs)}, sync=True
+        )
+
+
+class BatchJournal:
+    """
+    Crash-safe progress log of the inputs being extracted, kept in the data directory.
+
+    Every change is one appended JSON line: the input's state (queued, probing,
+    extracting or committed), the password found for a layer, or a candidate the layer
+    rejected. After a crash, the next run skips inputs
+    whose outputs were committed and reuses the passwords and rejections of the others
+    instead of searching again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.inputs = {}  # key -> {"state", "layer", "passwords", "rejected", "outputs", "ts"}
+        self.lines = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb+") as f:
+                    good_end = 0
+                    for line in iter(f.readline, b""):
+                        try:
+                            self._apply(json.loads(line))
+                        except (ValueError, KeyError, TypeError):
+                            # 崩溃时写了一半的最后一行，截掉以免后续追加接在残行后面
+                            f.truncate(good_end)
+                            break
+                        self.lines += 1
+                        good_end = f.tell()
+            except OSError as e:
+                print_warning(f"读取批处理日志失败喵，将从头开始处理：{e}")
+                self.inputs = {}
+        self._compact()
+
+    def _apply(self, change):
+        record = self.inputs.get(change["k"])
+        if record is None or "snapshot" in change:
+            record = change.get("snapshot") or {
+                "state": "queued",
+                "layer": None,
+                "passwords": {},
+                "rejected": {},
+                "outputs": None,
+                "ts": 0,
+            }
+            self.inputs[change["k"]] = record
+            if "snapshot" in change:
+                return
+        record["ts"] = change.get("ts", record["ts"])
+        if "state" in change:
+            record["state"] = change["state"]
+            record["layer"] = change.get("layer")
+            if change["state"] == "queued":
+                record["outputs"] = None
+            if "outputs" in change:
+                record["outputs"] = change["outputs"]
+                record["rejected"] = {}
+        elif "password" in change:
+            record["passwords"][str(change["layer"])] = change["password"]
+        elif "rejected" in change:
+            record["rejected"].setdefault(str(change["layer"]), []).append(change["rejected"])
+
+    def _needs_compaction(self):
+        # 快照行数本身就超过阈值时，等日志再增长一倍才整理，避免每次追加都重写整个文件
+        return self.lines > max(JOURNAL_COMPACT_LINES, 2 * len(self.inputs))
+
+    def _compact(self):
+        """Rewrites the journal with one snapshot line per input still worth keeping."""
+        cutoff = time.time() - JOURNAL_RETENTION_DAYS * 86400
+        stale = [key for key, record in self.inputs.items() if record["ts"] < cutoff]
+        if not stale and not self._needs_compaction() and os.path.exists(self.path):
+            self._file = open(self.path, "a", encoding="utf-8")
+            return
+        for key in stale:
+            del self.inputs[key]
+        temp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for key, record in self.inputs.items():
+                    f.write(json.dumps({"k": key, "snapshot": record}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.lines = len(self.inputs)
+            self._file = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            print_warning(f"整理批处理日志失败喵，本次不记录进度：{e}")
+            self._file = None
+
+    def _append(self, change, sync):
+        change["ts"] = time.time()
+        line = json.dumps(change, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._apply(change)
+            if self._file is None:
+                return
+            try:
+                self._file.write(line)
+                self._file.flush()
+                if sync:
+                    os.fsync(self._file.fileno())
+                self.lines += 1
+            except OSError as e:
+                print_warning(f"写入批处理日志失败喵，本次不再记录进度：{e}")
+                self._file = None
+                return
+            if self._needs_compaction():
+                # 长时间运行（如守护进程模式）时也要定期整理，日志不会无限增长
+                self._file.close()
+                self._compact()
+
+    def entry(self, file_path):
+        """Returns the `JournalEntry` of an input, or the null entry if it cannot be identified."""
+        try:
+            return JournalEntry(self, input_key(file_path))
+        except OSError:
+            return NULL_JOURNAL_ENTRY
+
+    def committed_outputs(self, file_path):
+        """Outputs of an earlier run that committed this exact input and still exist, else None."""
+        try:
+            key = input_key(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            record = self.inputs.get(key)
+            if record is None or record["state"] != "committed":
+                return None
+            outputs = record["outputs"] or []
+        if outputs and not all(os.path.lexists(path) for path in outputs):
+            return None
+        return outputs
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
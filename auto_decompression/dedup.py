@@ -0,0 +1,148 @@
+import filecmp
+import os
+import shutil
+import threading
+
+from housekeeping import _normalize_path_for_compare, _pick_unique_name
+from password_cache import compute_archive_fingerprint
+from structure import get_archive_base_name, list_related_archive_parts
+
+DEDUP_MODES = ("copy", "link", "skip", "off")
+DEFAULT_DEDUP_MODE = "copy"
+
+
+def _related_parts(file_path):
+    try:
+        return list_related_archive_parts(file_path)
+    except Exception:
+        return [file_path]
+
+
+def same_content(file_path, original):
+    """Byte-for-byte comparison of two inputs, volume by volume; False when either is gone."""
+    parts = _related_parts(file_path)
+    original_parts = _related_parts(original)
+    if len(parts) != len(original_parts):
+        return False
+    try:
+        return all(
+            filecmp.cmp(part, original_part, shallow=False)
+            for part, original_part in zip(parts, original_parts)
+        )
+    except OSError:
+        return False
+
+
+class InputDeduplicator:
+    """
+    Detects inputs whose archive bytes match an input seen earlier in the batch.
+
+    Inputs are keyed by the fingerprints of their volumes (size + head/tail hash), which
+    are computed before taking the lock, so registering an input never reads whole
+    archives. A fingerprint match is only a candidate: the caller confirms it with
+    `same_content()` when the batch is settled, after the original has been extracted.
+    The state only covers one batch and is reset by `take_batch()`.
+    """
+
+    def __init__(self):
+        self._by_fingerprint = {}  # tuple of volume fingerprints -> [original path, ...]
+        self._results = {}  # original path -> committed output paths, or None on failure
+        self._duplicates = []  # (duplicate path, original path)
+        self._lock = threading.Lock()
+
+    def add(self, file_path):
+        """Registers an input; returns True when it looks like a duplicate of an earlier one."""
+        try:
+            key = tuple(compute_archive_fingerprint(part) for part in _related_parts(file_path))
+        except OSError:
+            return False
+        normalized = _normalize_path_for_compare(os.path.abspath(file_path))
+        with self._lock:
+            candidates = self._by_fingerprint.setdefault(key, [])
+            for original in candidates:
+                if _normalize_path_for_compare(os.path.abspath(original)) == normalized:
+                    continue  # 同一个文件再次入队（例如提供密码后重新解压）不算重复
+                self._duplicates.append((file_path, original))
+                return True
+            candidates.append(file_path)
+        return False
+
+    def record_result(self, original, outputs):
+        """Stores the committed output paths of an input, or None when it failed."""
+        with self._lock:
+            self._results[original] = outputs
+
+    def take_batch(self):
+        """
+        Returns ([(duplicate, original, outputs or None)], {input: outputs}) and forgets the batch.
+
+        The dict holds every input of the batch that was extracted successfully. Only call
+        it when no input of the batch is still being extracted.
+        """
+        with self._lock:
+            duplicates = [
+                (duplicate, original, self._results.get(original))
+                for duplicate, original in self._duplicates
+            ]
+            succeeded = {
+                path: outputs for path, outputs in self._results.items() if outputs is not None
+            }
+            self._by_fingerprint = {}
+            self._results = {}
+            self._duplicates = []
+            return duplicates, succeeded
+
+
+def _output_name(name, is_dir, original_base, duplicate_base):
+    """Renames outputs named after the original archive so they follow the duplicate's name."""
+    if name == original_base:
+        return duplicate_base
+    stem, ext = os.path.splitext(name)
+    if not is_dir and stem == original_base:
+        return duplicate_base + ext
+    return name
+
+
+def _link_tree(src, dest):
+    os.makedirs(dest)
+    for entry in os.scandir(src):
+        target = os.path.join(dest, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            _link_tree(entry.path, target)
+        else:
+            try:
+                os.link(entry.path, target)
+            except OSError:
+                shutil.copy2(entry.path, target)
+
+
+def replicate_outputs(outputs, original, duplicate, link=False):
+    """
+    Reproduces an original's extracted outputs next to `duplicate` and returns the new paths.
+
+    With `link`, files are hard-linked where the filesystem allows it and copied otherwise.
+    """
+    dest_dir = os.path.dirname(duplicate) or "."
+    original_base = get_archive_base_name(original)
+    duplicate_base = get_archive_base_name(duplicate)
+    created = []
+    for output in outputs:
+        if not os.path.lexists(output):
+            continue
+        is_dir = os.path.isdir(output) and not os.path.islink(output)
+        desired = _output_name(os.path.basename(output), is_dir, original_base, duplicate_base)
+        target = os.path.join(dest_dir, _pick_unique_name(dest_dir, desired, is_dir))
+        if is_dir:
+            if link:
+                _link_tree(output, target)
+            else:
+                shutil.copytree(output, target, symlinks=True)
+        elif link:
+            try:
+                os.link(output, target)
+            except OSError:
+                shutil.copy2(output, target)
+        else:
+            shutil.copy2(output, target, follow_symlinks=False)
+        created.append(target)
+    return created
@@ -4,7 +4,10 @@ import os
 import json
 import subprocess
 import re
-from rich.console import Console
+import mmap
+import errno
+import struct
+import zlib
 from rich.progress import (
     Progress,
     SpinnerColumn,
@@ -15,15 +18,36 @@ from rich.progress import (
     TimeElapsedColumn,
     TimeRemainingColumn,
 )
+from progress_display import console as shared_console, progress_task
+from tracing import trace_span
+
+CHUNK_SIZE = 256 * 1024 * 1024  # 256 MB, only used when a file cannot be memory-mapped
+COPY_BUFFER_SIZE = 8 * 1024 * 1024  # 8 MB, buffered fallback when the kernel cannot copy
+COPY_STEP_SIZE = 256 * 1024 * 1024  # 256 MB per copy_file_range / sendfile call (one progress step)
+# copy_file_range / sendfile 报这些错误时换用下一种复制方式
+_KERNEL_COPY_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EBADF,
+    errno.EPERM,
+}
 
-CHUNK_SIZE = 256 * 1024 * 1024  # 256 MB
-COPY_BUFFER_SIZE = 8 * 1024 * 1024  # 8 MB
-
-console = Console()
+console = shared_console
 
 # Search mode: True for binwalk, False for manual signature scanning
 USE_BINWALK = False
 
+# Manual search order: "full" scans the whole file; "head-first" searches the first
+# SCAN_WINDOW_SIZE bytes first and stops there if an embedded archive is found;
+# "tail-first" stops at the last SCAN_WINDOW_SIZE bytes only for a ZIP / 7z archive whose
+# own headers prove it starts there and runs to the end of the file
+SCAN_STRATEGIES = ("full", "head-first", "tail-first")
+SCAN_STRATEGY = "full"
+SCAN_WINDOW_SIZE = 64 * 1024 * 1024  # 64 MB
+
 MAGIC_SIGNATURES = {
     "zip": b"PK\x03\x04",
     "rar": b"Rar!\x1a\x07",
@@ -44,22 +68,52 @@ MAGIC_SIGNATURES = {
 _BINWALK_INSTALLED = None
 _BINWALK_RESULTS_CACHE = {}
 
+def _kernel_copy_range(f_in, f_out, offset, size, advance):
+    """
+    Copies [offset, offset + size) inside the kernel; returns the number of bytes copied.
+
+    Tries os.copy_file_range first (which reflinks on btrfs/XFS and copies server-side on
+    network filesystems), then os.sendfile. Stops early when neither is available so the
+    caller can finish the remainder with a buffered copy.
+    """
+    fd_in, fd_out = f_in.fileno(), f_out.fileno()
+    copied = 0
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        try:
+            while copied < size:
+                step = min(COPY_STEP_SIZE, size - copied)
+                if method == "copy_file_range":
+                    count = os.copy_file_range(fd_in, fd_out, step, offset + copied, copied)
+                else:
+                    os.lseek(fd_out, copied, os.SEEK_SET)
+                    count = os.sendfile(fd_out, fd_in, offset + copied, step)
+                if count == 0:
+                    raise IOError("在提取嵌入文件时遇到意外的 EOF 喵。")
+                copied += count
+                advance(count)
+            return copied
+        except OSError as e:
+            # 跨文件系统、文件系统不支持等情况下换用下一种方式继续复制
+            if e.errno not in _KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+    return copied
+
+
 def _copy_range_with_progress(input_file, output_file, offset, size, signature):
     """Extracts a range from input to output file with a progress bar."""
     if size <= 0:
         raise ValueError(f"提取范围大小必须为正数喵：size={size}")
     total = size
-    buffer = bytearray(COPY_BUFFER_SIZE)
-    mv = memoryview(buffer)
     display_name = f"{signature.upper()} ➜ {os.path.basename(output_file)}"
 
     console.print(f"[cyan][b]开始提取嵌入文件：{display_name}[/b][/cyan]")
 
-    with open(input_file, "rb") as f_in, open(output_file, "wb") as f_out:
-        f_in.seek(offset)
-        with Progress(
+    def create_progress():
+        return Progress(
             SpinnerColumn(finished_text="✅"),
-            TextColumn("[cyan][b]{task.fields[name]}[/b][/cyan]", justify="left"),
+            TextColumn("[cyan][b]{task.fields[filename]}[/b][/cyan]", justify="left"),
             BarColumn(),
             FileSizeColumn(),
             "•",
@@ -70,19 +124,32 @@ def _copy_range_with_progress(input_file, output_file, offset, size, signature):
             TimeRemainingColumn(),
             transient=True,
             console=console,
-        ) as progress:
-            task = progress.add_task("extract", total=total, name=display_name)
-            remaining = total
-            while remaining > 0:
-                chunk_size = COPY_BUFFER_SIZE if remaining > COPY_BUFFER_SIZE else remaining
-                read_count = f_in.readinto(mv[:chunk_size])
-                if read_count == 0:
-                    raise IOError("在提取嵌入文件时遇到意外的 EOF 喵。")
-                f_out.write(mv[:read_count])
-                remaining -= read_count
-                progress.update(task, advance=read_count)
+        )
+
+    with trace_span("embedded_copy", bytes=total, file=os.path.basename(input_file)) as trace, \
+            open(input_file, "rb") as f_in, open(output_file, "wb") as f_out:
+        with progress_task(create_progress, "extract", total, filename=display_name) as (progress, task):
+            def advance(count):
+                progress.update(task, advance=count)
+
+            copied = _kernel_copy_range(f_in, f_out, offset, total, advance)
+            remaining = total - copied
+            if remaining > 0:
+                buffer = bytearray(COPY_BUFFER_SIZE)
+                mv = memoryview(buffer)
+                f_in.seek(offset + copied)
+                f_out.seek(copied)
+                while remaining > 0:
+                    chunk_size = COPY_BUFFER_SIZE if remaining > COPY_BUFFER_SIZE else remaining
+                    read_count = f_in.readinto(mv[:chunk_size])
+                    if read_count == 0:
+                        raise IOError("在提取嵌入文件时遇到意外的 EOF 喵。")
+                    f_out.write(mv[:read_count])
+                    remaining -= read_count
+                    advance(read_count)
+                del mv
+        trace.finish(kernel_bytes=copied)
 
-    del mv
     console.print(f"[green][b]嵌入文件提取完成：{output_file}[/b][/green]")
 
 def _check_binwalk_installed():
@@ -160,6 +227,11 @@ def _pick_highest_confidence(filename, signature):
 
 def has_embedded_signature(filename, signature):
     """Determines if a file contains an embedded archive based on the current search mode."""
+    with trace_span("embedded_scan", file=os.path.basename(filename), signature=signature):
+        return _has_embedded_signature(filename, signature)
+
+
+def _has_embedded_signature(filename, signature):
     if USE_BINWALK:
         # 使用 binwalk 搜索
         if not _check_binwalk_installed():
@@ -184,45 +256,214 @@ def has_embedded_signature(filename, signature):
             return _find_first_magic_signature(filename, signature.lower()) is not None
 
 
+# 嵌入文件排序时压缩格式优先，顺序与 recursive_extract 的尝试顺序一致
+EMBEDDED_ARCHIVE_PRIORITY = ("zip", "rar5", "rar", "7z")
+TAR_MAGIC_OFFSET = 257  # TAR signature is at offset 257
+
+_SIGNATURE_SCAN_CACHE = {}
+
+ZIP_EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP_EOCD_SIZE = 22
+ZIP_MAX_COMMENT_SIZE = 0xFFFF
+SEVENZIP_START_HEADER_SIZE = 32
+
+
+def _compile_signature_pattern(signatures):
+    # 长签名优先，使同一位置上的 RAR5 与 RAR4 都能被识别
+    ordered = sorted(signatures.values(), key=len, reverse=True)
+    return re.compile(b"|".join(re.escape(sig) for sig in ordered))
+
+
+def _scan_cache_key(input_file):
+    stat = os.stat(input_file)
+    return (os.path.normcase(os.path.abspath(input_file)), stat.st_size, stat.st_mtime_ns)
+
+
+def _scan_buffer(buffer, base, start, end, remaining, offsets):
+    """Searches buffer[start:end] for the remaining signatures, recording `base + position`."""
+    pattern = _compile_signature_pattern(remaining)
+    pos = start
+    while remaining:
+        match = pattern.search(buffer, pos, end)
+        if match is None:
+            return
+        found_at = match.start()
+        for name, sig in list(remaining.items()):
+            if buffer[found_at:found_at + len(sig)] == sig:
+                offsets[name] = base + found_at
+                del remaining[name]
+        if remaining:
+            pattern = _compile_signature_pattern(remaining)
+        pos = found_at + 1
+
+
+def _scan_range_chunked(f, start, end, remaining, offsets, overlap):
+    """Fallback for files that cannot be memory-mapped: reads [start, end) in CHUNK_SIZE blocks."""
+    chunk_offset = start
+    f.seek(chunk_offset)
+    while remaining and chunk_offset < end:
+        wanted = min(CHUNK_SIZE, end - chunk_offset)
+        chunk = f.read(wanted)
+        if not chunk:
+            return
+        _scan_buffer(chunk, chunk_offset, 0, len(chunk), remaining, offsets)
+        if len(chunk) < wanted or chunk_offset + len(chunk) >= end:
+            return
+        # 回退 最长魔法头长度-1 个字节，以防签名跨块
+        chunk_offset += len(chunk) - overlap
+        f.seek(chunk_offset)
+
+
+def _scan_plan(size, overlap):
+    """Splits the file into search windows according to SCAN_STRATEGY."""
+    window = SCAN_WINDOW_SIZE
+    if SCAN_STRATEGY == "full" or size <= window:
+        return [(0, size)]
+    if SCAN_STRATEGY == "tail-first":
+        # 尾部没有压缩包时从头完整扫描，保证得到的仍是各签名的首次出现位置
+        return [(size - window, size), (0, size)]
+    return [(0, window), (window - overlap, size)]
+
+
+def _read_at(f, mapped, offset, length):
+    if mapped is not None:
+        return mapped[offset:offset + length]
+    f.seek(offset)
+    return f.read(length)
+
+
+def _zip_start_from_eocd(f, mapped, size):
+    """
+    Start of a ZIP archive that ends the file, located through its end-of-central-directory.
+
+    A local header found in the tail window is usually in the middle of a large archive;
+    the central directory offset leads back to the first one. Returns None for ZIP64 or
+    when the records do not line up.
+    """
+    tail_start = max(0, size - ZIP_EOCD_SIZE - ZIP_MAX_COMMENT_SIZE)
+    tail = _read_at(f, mapped, tail_start, size - tail_start)
+    pos = tail.rfind(ZIP_EOCD_SIGNATURE)
+    while pos >= 0:
+        record = tail[pos:pos + ZIP_EOCD_SIZE]
+        if len(record) == ZIP_EOCD_SIZE:
+            cd_size, cd_offset, comment_size = struct.unpack("<IIH", record[12:22])
+            if pos + ZIP_EOCD_SIZE + comment_size == len(tail) and cd_offset != 0xFFFFFFFF:
+                start = tail_start + pos - cd_size - cd_offset
+                if start >= 0 and _read_at(f, mapped, start, 4) == MAGIC_SIGNATURES["zip"]:
+                    return start
+        pos = tail.rfind(ZIP_EOCD_SIGNATURE, 0, pos)
+    return None
+
+
+def _is_7z_ending_file(f, mapped, offset, size):
+    """True when a valid 7z start header sits at `offset` and its archive ends the file."""
+    header = _read_at(f, mapped, offset, SEVENZIP_START_HEADER_SIZE)
+    if len(header) < SEVENZIP_START_HEADER_SIZE or not header.startswith(MAGIC_SIGNATURES["7z"]):
+        return False
+    (start_header_crc,) = struct.unpack("<I", header[8:12])
+    if zlib.crc32(header[12:32]) != start_header_crc:
+        return False
+    next_header_offset, next_header_size = struct.unpack("<QQ", header[12:28])
+    return offset + SEVENZIP_START_HEADER_SIZE + next_header_offset + next_header_size == size
+
+
+def _validated_tail_archives(f, mapped, size, offsets):
+    """Archive offsets from the tail window that are provably where the archive starts."""
+    validated = {}
+    zip_start = _zip_start_from_eocd(f, mapped, size)
+    if zip_start is not None:
+        validated["zip"] = zip_start
+    if "7z" in offsets and _is_7z_ending_file(f, mapped, offsets["7z"], size):
+        validated["7z"] = offsets["7z"]
+    return validated
+
+
+def scan_magic_signatures(input_file):
+    """
+    Finds the first offset of every entry in MAGIC_SIGNATURES in a single pass.
+
+    The file is memory-mapped and searched in place with one combined regex, so no chunk
+    copies are made and peak memory stays flat regardless of file size. A signature is
+    dropped from the pattern as soon as it is found. With head-first, the search stops
+    after the head window if it contains an embedded archive; with tail-first, only after
+    the tail window when a ZIP / 7z there is validated against its own headers (a bare
+    signature near the end is usually inside the archive). Results are cached per (path, size, mtime, strategy) so detection and
+    extraction share one scan.
+    """
+    key = _scan_cache_key(input_file) + (SCAN_STRATEGY,)
+    cached = _SIGNATURE_SCAN_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    offsets = {}
+    remaining = {name: sig for name, sig in MAGIC_SIGNATURES.items() if name != "tar"}
+    overlap = max(len(sig) for sig in remaining.values()) - 1
+
+    with open(input_file, "rb") as f:
+        # 特殊处理：TAR文件的魔法头在第257字节处
+        f.seek(TAR_MAGIC_OFFSET)
+        if f.read(len(MAGIC_SIGNATURES["tar"])) == MAGIC_SIGNATURES["tar"]:
+            offsets["tar"] = TAR_MAGIC_OFFSET
+
+        size = os.fstat(f.fileno()).st_size
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        except (OSError, ValueError):
+            mapped = None
+
+        try:
+            if mapped is not None and hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            plan = _scan_plan(size, overlap)
+            for index, (start, end) in enumerate(plan):
+                if start == 0 and index > 0:
+                    offsets = {k: v for k, v in offsets.items() if k == "tar"}
+                    remaining = {
+                        name: sig for name, sig in MAGIC_SIGNATURES.items() if name != "tar"
+                    }
+                if mapped is not None:
+                    _scan_buffer(mapped, 0, start, end, remaining, offsets)
+                else:
+                    _scan_range_chunked(f, start, end, remaining, offsets, overlap)
+                if index < len(plan) - 1:
+                    if SCAN_STRATEGY == "tail-first":
+                        validated = _validated_tail_archives(f, mapped, size, offsets)
+                        if validated:
+                            offsets = {k: v for k, v in offsets.items() if k == "tar"}
+                            offsets.update(validated)
+                            break
+                        continue
+                    if any(name in offsets for name in EMBEDDED_ARCHIVE_PRIORITY):
+                        break
+                if not remaining:
+                    break
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    _SIGNATURE_SCAN_CACHE[key] = offsets
+    return offsets
+
+
+def ranked_signature_offsets(input_file):
+    """Returns `[(signature, offset), ...]` with embedded archives first, then by offset."""
+    offsets = scan_magic_signatures(input_file)
+    ranked = [(name, offsets[name]) for name in EMBEDDED_ARCHIVE_PRIORITY if name in offsets]
+    ranked.extend(
+        sorted(
+            ((name, off) for name, off in offsets.items() if name not in EMBEDDED_ARCHIVE_PRIORITY),
+            key=lambda item: item[1],
+        )
+    )
+    return ranked
+
+
 def _find_first_magic_signature(input_file, signature_type):
     """Locates the first occurrence of a magic signature in a file."""
     if signature_type not in MAGIC_SIGNATURES:
         return None
-    
-    magic_bytes = MAGIC_SIGNATURES[signature_type]
-    
-    with open(input_file, 'rb') as f:
-        # 特殊处理：TAR文件的魔法头在第257字节处
-        if signature_type == "tar":
-            f.seek(257)  # TAR魔法头位置
-            data = f.read(len(magic_bytes))
-            if data == magic_bytes:
-                return 257
-            else:
-                return None
-        
-        # 对于其他文件类型，在整个文件中搜索
-        # 分块读取以处理大文件
-        offset = 0
-        while True:
-            chunk = f.read(CHUNK_SIZE)
-            if not chunk:
-                break
-            
-            pos = chunk.find(magic_bytes)
-            if pos != -1:
-                return offset + pos
-            
-            # 处理跨块边界的情况
-            # 保留最后几个字节以防魔法头被分割
-            if len(chunk) == CHUNK_SIZE:
-                # 回退魔法头长度-1个字节，以防跨块
-                f.seek(f.tell() - len(magic_bytes) + 1)
-                offset = f.tell()
-            else:
-                break
-        
-        return None
+    return scan_magic_signatures(input_file).get(signature_type)
+
 
 def extract_embedded_file(input_file, output_file, signature):
     """Extracts embedded data starting from a detected signature."""
@@ -1,13 +1,30 @@
 import os
-import re
 import subprocess
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 
 import rich.progress
-from rich.console import Console
 from rich.progress import Progress
 
-console = Console()
+from progress_display import console, console_prompt, progress_task
+from sevenzip_output import (
+    ERROR_RESULT_CODES,
+    EVENT_COMPLETED,
+    EVENT_ERROR,
+    EVENT_FILE,
+    EVENT_PERCENT,
+    SevenZipOutputParser,
+    classify_error_line,
+    read_chunks,
+)
+from structure import get_total_split_size
+from tracing import trace_span
+
+
+# 规划密码验证时使用的占位密码，用于让加密文件头的压缩包立即报告“密码错误”而不是等待输入
+_PROBE_PLACEHOLDER_PASSWORD = "AutoDec.Probe"
+HEADLESS = False  # 守护进程模式：从不等待控制台输入，需要手动密码时直接放弃
 
 
 def print_info(message):
@@ -26,145 +43,96 @@ def print_warning(message):
     console.out(message, style="bold yellow underline")
 
 
-def get_total_split_size(file_path: str) -> int:
-    """Calculates combined size of all parts in a multi-volume archive."""
-    dir_name = os.path.dirname(file_path)
-    base_name = os.path.basename(file_path)
-
-    # 如果没有 '.'，直接返回当前文件大小
-    if "." not in base_name:
-        return os.path.getsize(file_path)
-
-    # 找到所有 '.' 的位置
-    dot_positions = [i for i, c in enumerate(base_name) if c == '.']
-    if len(dot_positions) == 1:
-        base_part = base_name[:dot_positions[0]]
-    else:
-        base_part = base_name[:dot_positions[-2]]
-
-    total_size = 0
-    for fname in os.listdir(dir_name or "."):
-        full_path = os.path.join(dir_name, fname)
-        if not os.path.isfile(full_path):
-            continue
-
-        # 对比相同策略所得的前缀
-        cur_dots = [i for i, c in enumerate(fname) if c == '.']
-        if not cur_dots:
-            continue
-        elif len(cur_dots) == 1:
-            cur_base_part = fname[:cur_dots[0]]
-        else:
-            cur_base_part = fname[:cur_dots[-2]]
-
-        if cur_base_part == base_part:
-            total_size += os.path.getsize(full_path)
-
-    return total_size
-
+def extract_with_7zip(file_path, extract_to, password: str = None, members=None):
+    """
+    Extracts archive using 7-Zip with real-time progress reporting.
 
-def extract_with_7zip(file_path, extract_to, password: str = None):
-    """Extracts archive using 7-Zip with real-time progress reporting."""
-    command = ["7z", "x", file_path, f"-o{extract_to}", "-y", "-bsp1", "-bb3", "-sccUTF-8"]
+    `members` limits extraction to those archive paths (matched literally, without
+    wildcards); by default everything is extracted.
+    """
+    command = ["7z", "x", f"-o{extract_to}", "-y", "-bsp1", "-bb3", "-sccUTF-8"]
     if password:
         command.extend(["-p" + password])
+    if members:
+        command.extend(["-spd", "--", file_path, *members])
+    else:
+        command.extend(["--", file_path])
 
-    # 启动7z进程
-    # Use explicit UTF-8 encoding for stdout/stderr to avoid crashes on Windows (defaulting to GBK)
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-        bufsize=1,
-    )
-
-    task = -1
-    last_percent = 0
     file_size = get_total_split_size(file_path)
     result = 1
-    err_log = ""
+    parser = SevenZipOutputParser()
+
+    def apply_events(events):
+        nonlocal result
+        for event in events:
+            if event.kind == EVENT_FILE:
+                progress.update(task, filename=event.value)
+            elif event.kind == EVENT_PERCENT:
+                progress.update(task, completed=event.value * file_size / 100)
+            elif event.kind == EVENT_COMPLETED:
+                progress.update(task, completed=file_size)
+            elif event.kind == EVENT_ERROR:
+                # 任何错误输出都意味着本次解压失败，已确定的密码/打开错误不会被后续错误覆盖
+                if process.poll() is None:
+                    process.terminate()
+                if result not in (-1, -2):
+                    result = ERROR_RESULT_CODES[event.value]
 
-    # 定义处理 stdout 的函数
     def handle_stdout():
-        nonlocal last_percent, task, result
-        for line in iter(process.stdout.readline, ""):
-            if process.poll() is not None:
-                break  # 进程已经结束
-            line = line.strip()
-            # print(": " + line)
-            if "- " in line:
-                current_file = line.split("- ", 1)[1].replace("\\", "/")
-                progress.update(task, filename=current_file, refresh=True)
-            if "%" in line:
-                match = re.search(r"(\d+)%", line)
-                if match:
-                    percent = int(match.group(0).replace("%", ""))
-                    progress_increment = (
-                        int((percent - last_percent) * file_size / 100) + 1
-                    )
-                    progress.update(task, advance=progress_increment, refresh=True)
-                    last_percent = percent
-            if "Everything is Ok" in line:
-                progress.update(
-                    task, advance=int(file_size - last_percent * file_size / 100) + 1
-                )
-                progress.refresh()
-
-    # 定义处理 stderr 的函数
+        for chunk in read_chunks(process.stdout):
+            apply_events(parser.feed_stdout(chunk))
+        apply_events(parser.flush_stdout())
+
     def handle_stderr():
-        nonlocal result
-        nonlocal err_log
-        for err_line in iter(process.stderr.readline, ""):
-            err_line = err_line.strip()
-            err_log += err_line + "\n"
-            # print_error(f"\n{err_line}\n")
-            if err_line:
-                process.terminate()
-                # 检查错误信息
-                if "wrong password" in err_line.lower():
-                    result = -1
-                    break
-                elif "cannot open" in err_line.lower():
-                    result = -2
-                    break
-                else:
-                    result = -3
+        for chunk in read_chunks(process.stderr):
+            apply_events(parser.feed_stderr(chunk))
+        apply_events(parser.flush_stderr())
 
     # 实时输出进度
-    with Progress(
-        rich.progress.SpinnerColumn(finished_text="✅"),
-        rich.progress.TextColumn(
-            "[cyan][b]{task.fields[filename]}[/cyan][/b]",
-            table_column=rich.progress.Column(max_width=75),
-        ),
-        rich.progress.BarColumn(),
-        "[progress.percentage]{task.percentage:>3.1f}%",
-        "•",
-        rich.progress.FileSizeColumn(),
-        "•",
-        rich.progress.TransferSpeedColumn(),
-        "•",
-        rich.progress.TimeElapsedColumn(),
-        "/",
-        rich.progress.TimeRemainingColumn(),
-        transient=True,
-    ) as progress:
-
-        task = progress.add_task("Decompress...", total=file_size, filename="")
-
-        # 启动线程来处理 stdout 和 stderr
-        stdout_thread = threading.Thread(target=handle_stdout)
-        stderr_thread = threading.Thread(target=handle_stderr)
-
-        stdout_thread.start()
-        stderr_thread.start()
-
-        # 等待线程完成
-        stdout_thread.join()
-        stderr_thread.join()
+    def create_progress():
+        return Progress(
+            rich.progress.SpinnerColumn(finished_text="✅"),
+            rich.progress.TextColumn(
+                "[cyan][b]{task.fields[filename]}[/cyan][/b]",
+                table_column=rich.progress.Column(max_width=75),
+            ),
+            rich.progress.BarColumn(),
+            "[progress.percentage]{task.percentage:>3.1f}%",
+            "•",
+            rich.progress.FileSizeColumn(),
+            "•",
+            rich.progress.TransferSpeedColumn(),
+            "•",
+            rich.progress.TimeElapsedColumn(),
+            "/",
+            rich.progress.TimeRemainingColumn(),
+            transient=True,
+        )
+
+    with trace_span("decompress", file=os.path.basename(file_path)) as trace:
+        # 启动7z进程，输出以原始字节读取，由 SevenZipOutputParser 统一解码（-sccUTF-8）
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+
+        with progress_task(create_progress, "Decompress...", file_size) as (progress, task):
+
+            # 启动线程来处理 stdout 和 stderr
+            stdout_thread = threading.Thread(target=handle_stdout)
+            stderr_thread = threading.Thread(target=handle_stderr)
+
+            stdout_thread.start()
+            stderr_thread.start()
+
+            # 等待线程完成
+            stdout_thread.join()
+            stderr_thread.join()
+        process.wait()
+        trace.finish(bytes=file_size, result=result)
+    err_log = parser.error_log
 
     if result == -1:
         print_info(f"密码 {password} 尝试错误喵。")
@@ -198,7 +166,8 @@ def extract_with_bandizip(file_path, extract_to, password=None):
         before_files = set()
 
     # 执行 Bandizip 解压
-    process = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    with trace_span("bandizip", file=os.path.basename(file_path)):
+        process = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='ignore')
     
     # 分析错误输出以确定具体错误类型
     stderr_output = process.stderr.lower()
@@ -285,9 +254,12 @@ def handle_bandizip_extraction(file_path, temp_folder, passwords, level):
             return None
 
     # 2. 如果字典密码都失败了，请求手动输入
+    if HEADLESS:
+        return None
     while True:
-        console.print(f"[cyan][b]（Bandizip）请输入第{level}层文件的解压密码喵：", end="")
-        password = input()
+        with console_prompt(), trace_span("prompt"):
+            console.print(f"[cyan][b]（Bandizip）请输入第{level}层文件的解压密码喵：", end="")
+            password = input()
         if not password:  # 用户直接回车，取消操作
             print_warning(f"用户跳过了文件 {file_path} 的手动密码输入喵，将跳过该文件。")
             return None
@@ -305,25 +277,327 @@ def handle_bandizip_extraction(file_path, temp_folder, passwords, level):
             return None
 
 
-def try_passwords(file_path, extract_to, passwords, last_tried_password):
-    """Iterates through dictionary passwords to find a match."""
-    for password in passwords:
-        password = password[0]
-        if last_tried_password == password:
+def _classify_7zip_failure(output: str) -> int:
+    """Maps 7z error output to the result codes used by `extract_with_7zip()`."""
+    return ERROR_RESULT_CODES[classify_error_line(output)]
+
+
+@dataclass
+class ArchiveEntry:
+    path: str
+    size: int = 0
+    packed_size: int = 0
+    crc: str = ""
+    encrypted: bool = False
+    is_dir: bool = False
+
+
+@dataclass
+class ArchiveListing:
+    archive_type: str = ""
+    solid: bool = False
+    entries: list = field(default_factory=list)
+
+
+@dataclass
+class PasswordProbe:
+    """
+    Describes the cheapest way to check a password for one archive.
+
+    mode:
+        "header"  - encrypted headers, listing the archive is the check
+        "entry"   - test only `entry` (smallest or first encrypted member)
+        "none"    - nothing is encrypted, any password works
+        "archive" - listing was inconclusive, test the whole archive
+        "invalid" - 7z cannot open the file at all
+    """
+
+    mode: str
+    entry: str = None
+    listing: ArchiveListing = None
+
+
+def _parse_int(value: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _parse_slt_listing(output: str) -> ArchiveListing:
+    """Parses the `7z l -slt` technical listing into an `ArchiveListing`."""
+    listing = ArchiveListing()
+    head, sep, body = output.partition("\n----------\n")
+    for line in head.splitlines():
+        key, _, value = line.partition(" = ")
+        if key == "Type":
+            listing.archive_type = value.strip()
+        elif key == "Solid":
+            listing.solid = value.strip() == "+"
+    if not sep:
+        return listing
+
+    for block in body.split("\n\n"):
+        props = {}
+        for line in block.splitlines():
+            key, eq, value = line.partition(" = ")
+            if eq:
+                props[key.strip()] = value
+        if "Path" not in props:
+            continue
+        attributes = props.get("Attributes", "")
+        listing.entries.append(
+            ArchiveEntry(
+                path=props["Path"],
+                size=_parse_int(props.get("Size")),
+                packed_size=_parse_int(props.get("Packed Size")),
+                crc=props.get("CRC", ""),
+                encrypted=props.get("Encrypted") == "+",
+                is_dir=props.get("Folder") == "+" or attributes.startswith("D"),
+            )
+        )
+    return listing
+
+
+def list_archive_entries(file_path, password: str = None):
+    """
+    Lists archive members via `7z l -slt` without extracting anything.
+
+    Returns:
+        tuple: (result, ArchiveListing or None) where result is 1 on success, -1 for
+        wrong password (encrypted headers), -2 if not an archive, -3 for other errors.
+    """
+    command = ["7z", "l", "-slt", "-sccUTF-8", "-p" + (password or _PROBE_PLACEHOLDER_PASSWORD), "--", file_path]
+    with trace_span("list", file=os.path.basename(file_path)):
+        process = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+    if process.returncode != 0:
+        return _classify_7zip_failure(process.stderr + process.stdout), None
+    return 1, _parse_slt_listing(process.stdout.replace("\r\n", "\n"))
+
+
+def plan_password_probe(file_path) -> PasswordProbe:
+    """Inspects the archive once and picks the cheapest password check for it."""
+    result, listing = list_archive_entries(file_path)
+    if result == -1:
+        return PasswordProbe("header")
+    if result == -2:
+        return PasswordProbe("invalid")
+    if result != 1:
+        return PasswordProbe("archive")
+
+    encrypted = [entry for entry in listing.entries if entry.encrypted and not entry.is_dir]
+    if not encrypted:
+        return PasswordProbe("none", listing=listing)
+    if listing.solid:
+        # 固实压缩包中靠前的文件解码代价最小
+        target = encrypted[0]
+    else:
+        target = min(encrypted, key=lambda entry: entry.packed_size or entry.size)
+    return PasswordProbe("entry", entry=target.path, listing=listing)
+
+
+def test_password_with_7zip(file_path, password: str = None, probe: PasswordProbe = None,
+                            cancel_event=None, running=None, lock=None):
+    """
+    Checks a password without writing anything to disk.
+
+    Uses `7z l` for archives with encrypted headers and `7z t` limited to the probe entry
+    otherwise; without a probe the whole archive is tested.
+
+    Returns:
+        int: 1 if the password verifies, -1 for wrong password, -2 if the file cannot be
+        opened as an archive, -3 for inconclusive errors, 0 when cancelled.
+    """
+    if probe is not None and probe.mode == "none":
+        return 1
+    if probe is not None and probe.mode == "invalid":
+        return -2
+
+    if probe is not None and probe.mode == "header":
+        command = ["7z", "l", "-y", "-sccUTF-8"]
+    else:
+        command = ["7z", "t", "-y", "-bso0", "-bsp0", "-sccUTF-8"]
+    if password:
+        command.append("-p" + password)
+    command.extend(["--", file_path])
+    if probe is not None and probe.mode == "entry":
+        # -spd 禁用通配符匹配，保证文件名按字面过滤
+        command[2:2] = ["-spd"]
+        command.append(probe.entry)
+
+    if cancel_event is not None and cancel_event.is_set():
+        return 0
+
+    with trace_span("verify", mode=probe.mode if probe is not None else "archive") as trace:
+        # stdin 置空，避免 7z 在缺少密码时等待交互输入
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        if running is not None:
+            with lock:
+                running.add(process)
+            # 注册前可能已经有其他密码验证成功
+            if cancel_event.is_set():
+                process.kill()
+        try:
+            _, err_output = process.communicate()
+        finally:
+            if running is not None:
+                with lock:
+                    running.discard(process)
+        trace.finish(returncode=process.returncode)
+
+    if cancel_event is not None and cancel_event.is_set():
+        return 0
+    if process.returncode == 0:
+        return 1
+    return _classify_7zip_failure(err_output)
+
+
+def verify_password(file_path, password: str = None, probe: PasswordProbe = None) -> int:
+    """
+    Gives a quick yes/no answer for a password before any extraction starts.
+
+    Returns:
+        int: 1 confirmed, -1 wrong password, -2 not an archive, 0 undetermined (only a
+        full extraction can tell).
+    """
+    if probe is None:
+        probe = plan_password_probe(file_path)
+    result = test_password_with_7zip(file_path, password, probe)
+    return result if result in (1, -1, -2) else 0
+
+
+def probe_passwords_concurrently(file_path, candidates, jobs, probe: PasswordProbe = None,
+                                 on_rejected=None):
+    """
+    Tests candidates with a bounded pool of `7z t` / `7z l` processes.
+
+    The first password that verifies wins and every other probe is cancelled.
+    `on_rejected` is called with every candidate reported as a wrong password.
+
+    Returns:
+        tuple: (password or None, list of candidates whose test was inconclusive)
+    """
+    cancel_event = threading.Event()
+    running = set()
+    lock = threading.Lock()
+    winner = None
+    inconclusive = []
+
+    print_info(f"使用 {jobs} 个并发任务探测 {len(candidates)} 个候选密码喵...")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                test_password_with_7zip, file_path, password, probe, cancel_event, running, lock
+            ): password
+            for password in candidates
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            if result == 1:
+                winner = futures[future]
+            elif result == -3:
+                inconclusive.append(futures[future])
+            elif result == -1 and on_rejected is not None:
+                on_rejected(futures[future])
+            if result not in (1, -2):
+                continue
+
+            # 找到密码或文件无法打开时，取消剩余的探测任务
+            cancel_event.set()
+            for pending in futures:
+                pending.cancel()
+            with lock:
+                for process in running:
+                    process.kill()
+            break
+
+    if winner is not None:
+        print_success(f"探测到密码 {winner} 喵！")
+    return winner, inconclusive
+
+
+def try_passwords(file_path, extract_to, passwords, last_tried_password, probe_jobs=1, probe=None,
+                  members=None, on_rejected=None):
+    """
+    Iterates through dictionary passwords to find a match.
+
+    `members` is passed to `extract_with_7zip()`; `on_rejected` is called with every
+    candidate verified to be wrong, so an interrupted search can resume.
+    """
+    candidates = [item[0] for item in passwords if item[0] != last_tried_password]
+    if probe is None:
+        probe = plan_password_probe(file_path)
+
+    if probe_jobs > 1:
+        rejected = set()
+        inconclusive = []
+
+        def reject(candidate):
+            rejected.add(candidate)
+            if on_rejected is not None:
+                on_rejected(candidate)
+
+        while candidates:
+            password, undecided = probe_passwords_concurrently(
+                file_path, candidates, probe_jobs, probe, reject
+            )
+            inconclusive.extend(undecided)
+            if password is None:
+                break
+            if extract_with_7zip(file_path, extract_to, password, members) > 0:
+                return password
+            # 通过验证的密码解压失败：下一轮只探测还没有结论的候选密码
+            settled = rejected | set(inconclusive) | {password}
+            candidates = [candidate for candidate in candidates if candidate not in settled]
+        # 测试结果不明确的密码仍交给完整解压来判定
+        for candidate in inconclusive:
+            if extract_with_7zip(file_path, extract_to, candidate, members) > 0:
+                return candidate
+        return None
+
+    for password in candidates:
+        verdict = verify_password(file_path, password, probe)
+        if verdict == -1:
+            if on_rejected is not None:
+                on_rejected(password)
             continue
-        if extract_with_7zip(file_path, extract_to, password) > 0:
+        if verdict == -2:
+            return None
+        # 只有验证通过（或无法判定）时才真正解压
+        if extract_with_7zip(file_path, extract_to, password, members) > 0:
             return password
     return None
 
 
-def manual_password_entry(file_path, extract_to, level):
-    """Prompts user for password entry when dictionary lookup fails."""
+def manual_password_entry(file_path, extract_to, level, probe=None, members=None):
+    """Prompts user for password entry when dictionary lookup fails; never prompts in headless mode."""
+    if HEADLESS:
+        return None
     while True:
-        console.print(f"[cyan][b]请输入第{level}层文件的解压密码喵：", end="")
-        password = input()
+        with console_prompt(), trace_span("prompt"):
+            console.print(f"[cyan][b]请输入第{level}层文件的解压密码喵：", end="")
+            password = input()
         if password == "":
             print_warning(f"用户跳过了文件 {file_path} 的手动密码输入喵，将跳过该文件。")
             return None
-        if extract_with_7zip(file_path, extract_to, password) > 0:
+        if (
+            verify_password(file_path, password, probe) != -1
+            and extract_with_7zip(file_path, extract_to, password, members) > 0
+        ):
             return password
         print_warning("密码错误，请重新输入喵！")
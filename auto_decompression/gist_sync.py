@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+
+from housekeeping import print_warning
+
+GIST_API_URL = "https://api.github.com"  # Overridable with "api_url" in gist_config.json
+GIST_REQUEST_TIMEOUT = (5, 20)  # (connect, read) seconds for every Gist request
+GIST_EXIT_TIMEOUT = 15  # Seconds the exit path waits for an in-flight sync
+
+
+def dictionary_digest(dictionary) -> str:
+    """Order-independent content hash of a password dictionary."""
+    content = json.dumps(dictionary, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def merge_dictionaries(base, local, remote):
+    """
+    Three-way merge of password dictionaries.
+
+    Every password from either side is kept, and both sides' count changes relative to
+    `base` are added up. Without a base (the Gist was never synced from this machine)
+    the larger count wins, so shared history is not counted twice.
+    """
+    merged = dict(remote)
+    for password, count in local.items():
+        if password not in merged:
+            merged[password] = count
+        elif base is None:
+            merged[password] = max(merged[password], count)
+        else:
+            merged[password] = max(0, count + merged[password] - base.get(password, 0))
+    return merged
+
+
+class GistSyncState:
+    """
+    Remembers what the Gist held after the last successful pull or push.
+
+    Persisted next to `dict.json`, so a run that changed nothing does not upload, even
+    when the previous run never talked to the Gist. `base` is that content itself, the
+    common ancestor for `merge_dictionaries` when both sides changed since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.digest = None
+        self.remote_updated_at = None
+        self.base = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.digest = data.get("digest")
+            self.remote_updated_at = data.get("remote_updated_at")
+            self.base = data.get("base")
+        except Exception as e:
+            print_warning(f"读取 Gist 同步状态失败喵，下次退出时将重新上传：{e}")
+
+    def mark_synced(self, dictionary, remote_updated_at=None):
+        with self._lock:
+            self.base = dict(dictionary)
+            self.digest = dictionary_digest(self.base)
+            if remote_updated_at is not None:
+                self.remote_updated_at = remote_updated_at
+            data = {
+                "digest": self.digest,
+                "remote_updated_at": self.remote_updated_at,
+                "base": self.base,
+            }
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print_warning(f"保存 Gist 同步状态时出错喵：{e}")
+
+    def is_synced(self, dictionary):
+        return self.digest is not None and self.digest == dictionary_digest(dictionary)
+
+
+class GistSyncWorker:
+    """
+    Runs Gist uploads on a background thread so extraction never waits on the network.
+
+    Push requests made while an upload is running are coalesced into one follow-up
+    upload of the newest dictionary.
+    """
+
+    def __init__(self, push):
+        self.push = push
+        self.condition = threading.Condition()
+        self.requested = False
+        self.running = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request_push(self):
+        with self.condition:
+            self.requested = True
+            self.condition.notify_all()
+
+    def flush(self, timeout=GIST_EXIT_TIMEOUT):
+        """Waits until no upload is pending or running; returns False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.requested and not self.running, timeout=timeout
+            )
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.requested)
+                self.requested = False
+                self.running = True
+            try:
+                self.push()
+            except Exception as e:
+                print_warning(f"后台同步 Gist 时出错喵：{e}")
+            finally:
+                with self.condition:
+                    self.running = False
+                    self.condition.notify_all()
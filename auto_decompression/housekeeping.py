@@ -1,16 +1,25 @@
+import ctypes
+import errno
 import os
 import shutil
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import send2trash
-from rich.console import Console
 
-console = Console()
+from progress_display import console
+from tracing import trace_span, tracing_enabled
+
 RECOVER_SUFFIX = ".AutoDecRecovered"
+COMMIT_COPY_WORKERS = 4  # Parallel copies when extracted output has to cross devices
 
-# When extracted output reuses the source archive filename, we must avoid trashing the output
-# later in the global "trash-on-success" step.
-_RECYCLED_RESERVED_PATHS = set()
+# 并发任务可能同时向同一目录提交输出：命名与同设备重命名在锁内完成，
+# 跨设备复制期间占用的名字记录在这里，避免被其他任务抢走
+_commit_lock = threading.Lock()
+_claimed_names = {}
+_case_insensitive_devices = {}  # st_dev -> whether names on it compare case-insensitively
 
 
 def print_info(message):
@@ -57,7 +66,8 @@ def move_temp_folders_to_recycle_bin(current_directory):
     for folder in temp_folders:
         folder_path = os.path.join(current_directory, folder)
         try:
-            send2trash.send2trash(folder_path)
+            with trace_span("trash", file=folder):
+                send2trash.send2trash(folder_path)
             print_info(f"将 {folder_path} 移动到了回收站喵☆")
             recycled = True
         except Exception as e:
@@ -81,10 +91,14 @@ def create_unique_directory(base_path, dir_name):
     """Creates a directory with a unique name to avoid collisions."""
     counter = 1
     original_dir_name = dir_name
-    while os.path.exists(os.path.join(base_path, dir_name)):
-        dir_name = f"{original_dir_name}~{counter}"
-        counter += 1
-    os.makedirs(os.path.join(base_path, dir_name))
+    while True:
+        # 直接尝试创建而不是先检查，避免并发任务抢到同一个名字
+        try:
+            os.makedirs(os.path.join(base_path, dir_name))
+            break
+        except FileExistsError:
+            dir_name = f"{original_dir_name}~{counter}"
+            counter += 1
     print_success(f"创建目录：{dir_name}")
     return os.path.join(base_path, dir_name)
 
@@ -136,6 +150,14 @@ def move_path_with_collision_handling(
     temporary name first, then replaces the reserved path and renames into place. This
     avoids producing unnecessary '~1' suffixes.
     """
+    size = os.path.getsize(src_path) if tracing_enabled() and os.path.isfile(src_path) else None
+    with trace_span("move", bytes=size, file=os.path.basename(src_path)):
+        return _move_path_with_collision_handling(
+            src_path, dest_dir, reserved_paths, allow_replace_reserved
+        )
+
+
+def _move_path_with_collision_handling(src_path, dest_dir, reserved_paths, allow_replace_reserved):
     desired_name = os.path.basename(src_path)
     is_dir = os.path.isdir(src_path)
     desired_path = os.path.join(dest_dir, desired_name)
@@ -164,7 +186,6 @@ def move_path_with_collision_handling(
 
         try:
             os.rename(temp_path, desired_path)
-            _RECYCLED_RESERVED_PATHS.add(_normalize_path_for_compare(desired_path))
             return desired_path
         except Exception:
             fallback_name = _pick_unique_name(dest_dir, desired_name, is_dir=is_dir)
@@ -231,3 +252,239 @@ def detect_single_same_named_file(temp_folder, expected_base_name, entries=None)
     if entry_base.lower() != expected_base_name.lower():
         return None
     return entry_path
+
+
+def _pick_unique_name_in(taken: set, desired_name: str, is_dir: bool, fold) -> str:
+    """Like `_pick_unique_name()`, but checks a pre-listed set of names normalized by `fold`."""
+    candidate = desired_name
+    stem, ext = os.path.splitext(desired_name)
+    counter = 1
+    while fold(candidate) in taken:
+        candidate = f"{desired_name}~{counter}" if is_dir else f"{stem}~{counter}{ext}"
+        counter += 1
+    return candidate
+
+
+def _is_case_insensitive_dir(directory: str) -> bool:
+    """
+    Whether names in `directory` compare case-insensitively (NTFS, default APFS, ...).
+
+    Probed once per device with a temporary file, since the platform alone does not tell
+    (e.g. an NTFS or exFAT drive mounted on Linux).
+    """
+    try:
+        device = os.stat(directory).st_dev
+    except OSError:
+        return os.name == "nt"
+    cached = _case_insensitive_devices.get(device)
+    if cached is None:
+        try:
+            fd, probe_path = tempfile.mkstemp(prefix=".autodec-case-", dir=directory)
+            os.close(fd)
+            try:
+                cached = os.path.exists(
+                    os.path.join(directory, os.path.basename(probe_path).upper())
+                )
+            finally:
+                os.remove(probe_path)
+        except OSError:
+            cached = os.name == "nt" or sys.platform == "darwin"
+        _case_insensitive_devices[device] = cached
+    return cached
+
+
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+# 内核或文件系统不支持 RENAME_NOREPLACE 时返回的错误码
+_NOREPLACE_UNSUPPORTED = {errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def _load_renameat2():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None  # glibc 2.28 之前没有这个封装
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+_renameat2 = _load_renameat2()
+
+
+def _renameat2_no_replace(src_path: str, dest_path: str) -> bool:
+    """Atomic no-replace rename on Linux; False when the kernel or filesystem lacks it."""
+    if _renameat2 is None:
+        return False
+    if _renameat2(
+        _AT_FDCWD, os.fsencode(src_path), _AT_FDCWD, os.fsencode(dest_path), _RENAME_NOREPLACE
+    ) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in _NOREPLACE_UNSUPPORTED:
+        return False
+    raise OSError(err, os.strerror(err), src_path, None, dest_path)  # EEXIST -> FileExistsError
+
+
+def _rename_dir_by_claim(src_path: str, dest_path: str) -> None:
+    """Claims `dest_path` with an exclusive mkdir, then moves the children of `src_path` in."""
+    os.mkdir(dest_path)  # 目标已存在（包括空目录）时必定失败
+    moved = []
+    try:
+        for name in os.listdir(src_path):
+            os.rename(os.path.join(src_path, name), os.path.join(dest_path, name))
+            moved.append(name)
+        shutil.copystat(src_path, dest_path, follow_symlinks=False)
+        os.rmdir(src_path)
+    except OSError:
+        # 放回已移动的内容，保持源目录完整
+        for name in moved:
+            try:
+                os.rename(os.path.join(dest_path, name), os.path.join(src_path, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(dest_path)
+        except OSError:
+            pass
+        raise
+
+
+def _rename_no_replace(src_path: str, dest_path: str, is_dir: bool) -> None:
+    """`os.rename()` that raises FileExistsError instead of replacing `dest_path`."""
+    if os.name == "nt":
+        os.rename(src_path, dest_path)  # Windows 上目标已存在时本身就会报错
+        return
+    if _renameat2_no_replace(src_path, dest_path):
+        return
+    if is_dir:
+        # rename 会静默替换空目录，改为先用 mkdir 独占目标名
+        _rename_dir_by_claim(src_path, dest_path)
+        return
+    try:
+        # link 在目标已存在时必定失败，不会像 rename 那样静默覆盖
+        os.link(src_path, dest_path, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            raise
+        # 文件系统不支持硬链接（如 FAT/exFAT），退回到检查后重命名
+    else:
+        os.unlink(src_path)
+        return
+    if os.path.lexists(dest_path):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dest_path)
+    os.rename(src_path, dest_path)
+
+
+def _move_no_replace(src_path: str, dest_path: str, is_dir: bool) -> str:
+    """`shutil.move()` to `dest_path`, or to a fresh `~N` name if it appeared meanwhile."""
+    if os.path.lexists(dest_path):
+        dest_dir = os.path.dirname(dest_path)
+        dest_path = os.path.join(
+            dest_dir, _pick_unique_name(dest_dir, os.path.basename(dest_path), is_dir)
+        )
+    return shutil.move(src_path, dest_path)
+
+
+def _same_device(path_a: str, path_b: str) -> bool:
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def commit_entries(
+    src_folder: str,
+    entries: list,
+    dest_dir: str,
+    reserved_paths: set = None,
+    allow_replace_reserved: bool = False,
+) -> list:
+    """
+    Moves extracted entries from src_folder into dest_dir as one batch.
+
+    The destination is listed once and collisions are resolved against that set instead of
+    probing every candidate name (case-insensitively only where the filesystem is). On the
+    same device each entry is a single rename that never replaces a name created after the
+    listing; across devices the copies run in parallel. Entries colliding with a reserved path go
+    through `move_path_with_collision_handling()` so the source archive can be replaced.
+
+    Returns the final paths in the order of `entries`.
+    """
+    if not entries:
+        return []
+    dest_key = _normalize_path_for_compare(dest_dir)
+    same_device = _same_device(src_folder, dest_dir)
+    with os.scandir(src_folder) as it:
+        is_dir = {entry.name: entry.is_dir() for entry in it}
+
+    final_paths = [None] * len(entries)
+    reserved_moves = []
+    copies = []
+    with _commit_lock:
+        fold = str.casefold if _is_case_insensitive_dir(dest_dir) else str
+        claimed = _claimed_names.setdefault(dest_key, set())
+        taken = {fold(name) for name in os.listdir(dest_dir)} | claimed
+        for position, entry in enumerate(entries):
+            src_path = os.path.join(src_folder, entry)
+            entry_is_dir = is_dir.get(entry, False)
+            if fold(entry) in taken and allow_replace_reserved and _is_reserved_path(
+                os.path.join(dest_dir, entry), reserved_paths
+            ):
+                reserved_moves.append(position)
+                continue
+
+            while True:
+                name = _pick_unique_name_in(taken, entry, entry_is_dir, fold)
+                taken.add(fold(name))
+                dest_path = os.path.join(dest_dir, name)
+                if not same_device:
+                    break
+                try:
+                    _rename_no_replace(src_path, dest_path, entry_is_dir)
+                    final_paths[position] = dest_path
+                    break
+                except FileExistsError:
+                    continue  # 列出目录之后才出现的同名项，换下一个名字
+                except OSError as e:
+                    # 同一设备号也可能跨挂载点（如 bind mount），退回复制
+                    if e.errno != errno.EXDEV:
+                        raise
+                    break
+            if final_paths[position] is not None:
+                continue
+            claimed.add(fold(name))
+            copies.append((position, src_path, dest_path, entry_is_dir))
+
+    try:
+        if len(copies) == 1:
+            position, src_path, dest_path, entry_is_dir = copies[0]
+            final_paths[position] = _move_no_replace(src_path, dest_path, entry_is_dir)
+        elif copies:
+            with ThreadPoolExecutor(max_workers=min(COMMIT_COPY_WORKERS, len(copies))) as executor:
+                futures = {
+                    executor.submit(_move_no_replace, src_path, dest_path, entry_is_dir): position
+                    for position, src_path, dest_path, entry_is_dir in copies
+                }
+                for future, position in futures.items():
+                    final_paths[position] = future.result()
+    finally:
+        with _commit_lock:
+            claimed = _claimed_names.get(dest_key, set())
+            for _, _, dest_path, _ in copies:
+                claimed.discard(fold(os.path.basename(dest_path)))
+            if not claimed:
+                _claimed_names.pop(dest_key, None)
+
+    for position in reserved_moves:
+        final_paths[position] = move_path_with_collision_handling(
+            os.path.join(src_folder, entries[position]),
+            dest_dir,
+            reserved_paths=reserved_paths,
+            allow_replace_reserved=allow_replace_reserved,
+        )
+    return final_paths
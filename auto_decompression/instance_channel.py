@@ -0,0 +1,191 @@
+import json
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from housekeeping import print_error, print_warning
+
+SERVER_PORT = 65432  # Preferred local port; falls back to an OS-assigned port when taken
+IPC_HOST = "127.0.0.1"
+IPC_CONNECT_TIMEOUT = 15  # Seconds a secondary instance keeps retrying before giving up
+IPC_MAX_MESSAGE_BYTES = 16 * 1024 * 1024  # Larger requests are refused instead of read into memory
+
+
+def _send_message(conn, message):
+    # 只交换 JSON，不用 Connection.send()/recv() 自带的 pickle，避免反序列化执行代码
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+def _recv_message(conn):
+    return json.loads(conn.recv_bytes(IPC_MAX_MESSAGE_BYTES).decode("utf-8"))
+
+
+def _write_endpoint(endpoint_path, port, authkey):
+    """Writes the endpoint file readable by the current user only, since it holds the authkey."""
+    try:
+        # 旧文件可能是以更宽松的权限创建的，O_TRUNC 不会改变已有文件的权限
+        os.remove(endpoint_path)
+    except OSError:
+        pass
+    fd = os.open(endpoint_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"port": port, "authkey": authkey.hex(), "pid": os.getpid()}, f)
+
+
+def _read_endpoint(endpoint_path):
+    with open(endpoint_path, "r", encoding="utf-8") as f:
+        endpoint = json.load(f)
+    return endpoint["port"], bytes.fromhex(endpoint["authkey"])
+
+
+def send_request(endpoint_path, message, timeout=IPC_CONNECT_TIMEOUT):
+    """
+    Sends one request to the main instance and returns its reply.
+
+    The main instance may still be starting up, so connection failures are retried until
+    `timeout` seconds have passed. Returns None if it never became reachable.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            port, authkey = _read_endpoint(endpoint_path)
+            with Client((IPC_HOST, port), authkey=authkey) as conn:
+                _send_message(conn, message)
+                return _recv_message(conn)
+        except (OSError, EOFError, ValueError, KeyError, AuthenticationError):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.2)
+
+
+def send_file_to_main_instance(endpoint_path, file_paths):
+    print(str(file_paths))
+    # 两个实例的工作目录可能不同，统一转换为绝对路径
+    reply = send_request(
+        endpoint_path,
+        {"cmd": "add_files", "files": [os.path.abspath(p) for p in file_paths]},
+    )
+    if not reply:
+        print_error("无法连接到正在运行的实例，任务未能添加到队列喵。")
+        return False
+    if not reply.get("ok"):
+        print_error(f"任务未能添加到队列喵：{reply.get('error')}")
+        return False
+    return True
+
+
+class FileManager:
+    """
+    Receives work pushed by secondary instances over an authenticated local socket.
+
+    The listener thread blocks in `accept()` and hands incoming paths to a thread-safe
+    queue, so the main loop is woken immediately instead of polling a queue file. Other
+    commands are answered by handlers added with `register()`.
+    """
+
+    def __init__(self, endpoint_path):
+        self.endpoint_path = endpoint_path
+        self.files_to_process = queue.Queue()
+        self.handlers = {}  # cmd -> callable(message) returning the reply dict
+        self.accepting = True  # False once `close()` has taken the last files
+        self._accepting_lock = threading.Lock()
+        self.closed = False
+
+        authkey = os.urandom(16)
+        try:
+            self.listener = Listener((IPC_HOST, SERVER_PORT), authkey=authkey)
+        except OSError:
+            self.listener = Listener((IPC_HOST, 0), authkey=authkey)
+
+        _write_endpoint(endpoint_path, self.listener.address[1], authkey)
+
+        self.thread = threading.Thread(target=self.queue_listener, daemon=True)
+        self.thread.start()
+
+    def queue_listener(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            try:
+                self.handle_request(conn)
+            except (OSError, EOFError, ValueError) as e:
+                print_warning(f"处理来自其他实例的请求时出错喵：{e}")
+            finally:
+                conn.close()
+
+    def handle_request(self, conn):
+        message = _recv_message(conn)
+        if not isinstance(message, dict):
+            _send_message(conn, {"ok": False, "error": "invalid request"})
+            return
+        if message.get("cmd") == "add_files":
+            if not self.enqueue(*message.get("files", [])):
+                _send_message(conn, {"ok": False, "error": "主实例正在退出，不再接收新的文件"})
+                return
+            _send_message(conn, {"ok": True})
+            return
+        handler = self.handlers.get(message.get("cmd"))
+        if handler is not None:
+            try:
+                reply = handler(message)
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            _send_message(conn, reply)
+            return
+        _send_message(conn, {"ok": False, "error": f"unknown command: {message.get('cmd')}"})
+
+    def register(self, cmd, handler):
+        self.handlers[cmd] = handler
+
+    def enqueue(self, *file_paths):
+        """Queues paths as if another instance had pushed them; False once `close()` was called."""
+        with self._accepting_lock:
+            if not self.accepting:
+                return False
+            for file_path in file_paths:
+                self.files_to_process.put(file_path)
+        return True
+
+    def close(self):
+        """
+        Stops accepting files and returns those queued but not yet taken.
+
+        Every path acknowledged to another instance is either in the returned list or was
+        taken earlier; later pushes are refused, so the pusher can report the failure.
+        """
+        with self._accepting_lock:
+            self.accepting = False
+        return self.take_pending()
+
+    def take_pending(self, timeout=None):
+        """Returns every queued path; with `timeout`, waits that long for the first one."""
+        pending = []
+        try:
+            if timeout is not None:
+                pending.append(self.files_to_process.get(timeout=timeout))
+            while True:
+                pending.append(self.files_to_process.get_nowait())
+        except queue.Empty:
+            pass
+        return pending
+
+    def stop(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.listener.close()
+        except OSError:
+            pass
+        try:
+            os.remove(self.endpoint_path)
+        except OSError:
+            pass
+
+    def __del__(self):
+        self.stop()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from housekeeping import print_warning
+
+FINGERPRINT_EDGE_SIZE = 64 * 1024  # Bytes hashed from both the head and the tail of an archive
+DEFAULT_CACHE_CAPACITY = 4096  # Max remembered archives before the least recently used ones are evicted
+
+
+def compute_archive_fingerprint(file_path, listing=None) -> str:
+    """
+    Builds a cheap content fingerprint: size + hash of the first/last 64 KiB + 7z CRC listing.
+
+    `listing` is the `ArchiveListing` from `7z l -slt`; it is unavailable for archives with
+    encrypted headers, which is fine because that is stable for a given file.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_EDGE_SIZE))
+        if size > FINGERPRINT_EDGE_SIZE:
+            f.seek(max(FINGERPRINT_EDGE_SIZE, size - FINGERPRINT_EDGE_SIZE))
+            digest.update(f.read(FINGERPRINT_EDGE_SIZE))
+    if listing is not None:
+        for entry in listing.entries:
+            digest.update(f"{entry.path}\0{entry.size}\0{entry.crc}\n".encode("utf-8"))
+    return f"{size}-{digest.hexdigest()}"
+
+
+class PasswordCache:
+    """
+    Persistent fingerprint -> {password, depth} memo with LRU eviction.
+
+    Entries are kept in an OrderedDict whose order is the recency order, and the JSON file
+    stores them oldest first so the order survives a reload.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CACHE_CAPACITY):
+        self.path = path
+        self.capacity = max(0, capacity)
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def load(self):
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for fingerprint, entry in data.get("entries", []):
+                self.entries[fingerprint] = entry
+        except Exception as e:
+            print_warning(f"读取密码缓存失败喵，将重新建立缓存：{e}")
+            self.entries.clear()
+        self._evict()
+
+    def save(self):
+        if not self.enabled or not self.dirty:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            with self._lock:
+                entries = list(self.entries.items())
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            self.dirty = False
+        except Exception as e:
+            print_warning(f"保存密码缓存时出错喵：{e}")
+
+    def lookup(self, fingerprint):
+        """Returns the cached entry and marks it as most recently used."""
+        if not self.enabled or fingerprint is None:
+            return None
+        with self._lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                return None
+            self.entries.move_to_end(fingerprint)
+            entry["last_used"] = time.time()
+            self.dirty = True
+            return dict(entry)
+
+    def remember(self, fingerprint, password, depth):
+        if not self.enabled or fingerprint is None or password is None:
+            return
+        with self._lock:
+            self.entries[fingerprint] = {
+                "password": password,
+                "depth": depth,
+                "last_used": time.time(),
+            }
+            self.entries.move_to_end(fingerprint)
+            self.dirty = True
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.dirty = True
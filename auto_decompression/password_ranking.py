@@ -0,0 +1,142 @@
+import bisect
+import heapq
+import json
+import os
+import re
+import threading
+import time
+
+from housekeeping import print_warning
+from structure import get_archive_base_name
+
+MAX_TRACKED_PATTERNS = 2048  # Archive name patterns kept in the stats file before the oldest are dropped
+
+_DIGITS_REGEX = re.compile(r"\d+")
+
+
+def archive_name_pattern(file_path) -> str:
+    """Reduces an archive name to a pattern shared by its siblings (digit runs become '#')."""
+    base_name = get_archive_base_name(file_path).casefold().strip()
+    return _DIGITS_REGEX.sub("#", base_name)
+
+
+class PasswordRanker:
+    """
+    Keeps the password dictionary pre-ranked across a batch.
+
+    The base order (use count, then last success time) lives in a sorted key list that is
+    updated with bisect whenever `add_password` changes a count, so no layer has to re-sort
+    the whole dictionary. Per-archive context (name pattern, nesting depth) only reorders the
+    handful of passwords that succeeded in that context before.
+    """
+
+    def __init__(self, stats_path):
+        self.stats_path = stats_path
+        self.last_success = {}
+        self.by_pattern = {}
+        self.by_depth = {}
+        self._counts = None
+        self._keys = []
+        self._context_cache = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.last_success = dict(data.get("last_success", {}))
+            self.by_pattern = {k: dict(v) for k, v in data.get("by_pattern", {}).items()}
+            self.by_depth = {k: dict(v) for k, v in data.get("by_depth", {}).items()}
+        except Exception as e:
+            print_warning(f"读取密码统计信息失败喵，将重新统计：{e}")
+
+    def save(self):
+        temp_path = self.stats_path + ".tmp"
+        try:
+            with self._lock:
+                data = {
+                    "last_success": self.last_success,
+                    "by_pattern": self.by_pattern,
+                    "by_depth": self.by_depth,
+                }
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.stats_path)
+        except Exception as e:
+            print_warning(f"保存密码统计信息时出错喵：{e}")
+
+    def _key(self, pwd):
+        return (-self._counts.get(pwd, 0), -self.last_success.get(pwd, 0), pwd)
+
+    def bind(self, counts):
+        """Rebuilds the ranking when the dictionary object was replaced (e.g. pulled from Gist)."""
+        with self._lock:
+            if counts is self._counts and len(counts) == len(self._keys):
+                return
+            self._counts = counts
+            self._keys = sorted(self._key(pwd) for pwd in counts)
+            self._context_cache.clear()
+
+    def record(self, pwd, old_count, file_path=None, depth=None):
+        """Moves `pwd` to its new rank after its count changed from `old_count`."""
+        with self._lock:
+            if self._counts is None:
+                return
+            old_key = (-old_count, -self.last_success.get(pwd, 0), pwd)
+            index = bisect.bisect_left(self._keys, old_key)
+            if index < len(self._keys) and self._keys[index] == old_key:
+                del self._keys[index]
+
+            if self._counts.get(pwd, 0) > old_count:
+                self.last_success[pwd] = time.time()
+                if file_path is not None:
+                    pattern = archive_name_pattern(file_path)
+                    hits = self.by_pattern.pop(pattern, {})
+                    hits[pwd] = hits.get(pwd, 0) + 1
+                    self.by_pattern[pattern] = hits
+                    while len(self.by_pattern) > MAX_TRACKED_PATTERNS:
+                        self.by_pattern.pop(next(iter(self.by_pattern)))
+                if depth is not None:
+                    hits = self.by_depth.setdefault(str(depth), {})
+                    hits[pwd] = hits.get(pwd, 0) + 1
+
+            bisect.insort(self._keys, self._key(pwd))
+            self._context_cache.clear()
+
+    def candidates(self, counts, file_path=None, depth=None):
+        """Returns `(password, count)` pairs, best guesses first, for one archive layer."""
+        self.bind(counts)
+        pattern = archive_name_pattern(file_path) if file_path is not None else None
+        context = (pattern, depth)
+        with self._lock:
+            cached = self._context_cache.get(context)
+            if cached is not None:
+                return cached
+
+            # 同名模式下成功过的密码排在最前面
+            pattern_hits = self.by_pattern.get(pattern, {})
+            depth_hits = self.by_depth.get(str(depth), {})
+
+            def context_key(pwd):
+                base = self._key(pwd)
+                return (base[0] - depth_hits.get(pwd, 0),) + base[1:]
+
+            front = sorted(
+                (pwd for pwd in pattern_hits if pwd in self._counts),
+                key=lambda pwd: (-pattern_hits[pwd],) + context_key(pwd),
+            )
+            skip = set(front)
+            # 同层级的成功次数叠加到使用次数上，只需对这一小部分重新排序再与预排序列表归并
+            boosted = sorted(
+                (context_key(pwd) for pwd in depth_hits if pwd in self._counts and pwd not in skip)
+            )
+            skip.update(key[2] for key in boosted)
+            rest = (key for key in self._keys if key[2] not in skip)
+
+            ranked = [(pwd, self._counts[pwd]) for pwd in front]
+            ranked.extend((key[2], self._counts[key[2]]) for key in heapq.merge(boosted, rest))
+            self._context_cache[context] = ranked
+            return ranked
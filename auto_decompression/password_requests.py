@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+
+from housekeeping import print_warning
+
+
+class PasswordNeeded:
+    """
+    Returned by `recursive_extract` in headless mode when no known password opens a layer.
+
+    It is truthy like the plain "skipped" result, so callers that only distinguish success
+    from failure keep working; the layers above it are discarded instead of committed.
+    """
+
+    def __init__(self, layer_file, level):
+        self.layer_file = layer_file
+        self.level = level
+
+    def __bool__(self):
+        return True
+
+
+class PasswordRequestQueue:
+    """
+    Inputs parked until someone supplies a password over the local IPC channel.
+
+    Persisted in the data directory so parked inputs survive a daemon restart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.requests = {}  # id -> {"id", "file", "layer", "layer_file", "since", "duplicate_of"}
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for request in data.get("requests", []):
+                self.requests[request["id"]] = request
+            self.next_id = max(self.requests, default=0) + 1
+        except Exception as e:
+            print_warning(f"读取待输入密码队列失败喵：{e}")
+
+    def _save(self):
+        data = {"requests": sorted(self.requests.values(), key=lambda request: request["id"])}
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print_warning(f"保存待输入密码队列时出错喵：{e}")
+
+    def park(self, file_path, needed, duplicate_of=None):
+        """
+        Parks an input (or updates its request when it is parked again); returns the id.
+
+        `duplicate_of` names the parked input this one is byte-identical to; answering
+        that input's request re-queues this one too.
+        """
+        with self._lock:
+            request = next(
+                (request for request in self.requests.values() if request["file"] == file_path),
+                None,
+            )
+            if request is None:
+                request = {"id": self.next_id, "file": file_path}
+                self.requests[self.next_id] = request
+                self.next_id += 1
+            request.update(
+                layer=needed.level,
+                layer_file=os.path.basename(needed.layer_file),
+                since=time.time(),
+                duplicate_of=duplicate_of,
+            )
+            self._save()
+            return request["id"]
+
+    def list(self):
+        with self._lock:
+            return sorted(
+                (dict(request) for request in self.requests.values()),
+                key=lambda request: request["id"],
+            )
+
+    def find(self, file_path):
+        """Returns a copy of the request parking `file_path`, or None."""
+        with self._lock:
+            for request in self.requests.values():
+                if request["file"] == file_path:
+                    return dict(request)
+        return None
+
+    def take_duplicates_of(self, file_path):
+        """Removes and returns the requests of inputs parked as duplicates of `file_path`."""
+        with self._lock:
+            taken = [
+                self.requests.pop(request_id)
+                for request_id, request in list(self.requests.items())
+                if request.get("duplicate_of") == file_path
+            ]
+            if taken:
+                self._save()
+            return taken
+
+    def restore(self, requests):
+        """Puts taken requests back, e.g. when they could not be re-queued."""
+        with self._lock:
+            for request in requests:
+                self.requests[request["id"]] = request
+            self._save()
+
+    def take(self, request_id):
+        """Removes and returns a request, or None if the id is unknown."""
+        with self._lock:
+            request = self.requests.pop(request_id, None)
+            if request is not None:
+                self._save()
+            return request
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+
+from gist_sync import dictionary_digest
+from housekeeping import print_warning
+
+LOG_SUFFIX = ".log"  # Change log kept next to dict.json
+COMPACT_LOG_ENTRIES = 1000  # Log lines after which the log is folded back into dict.json
+
+
+class PasswordStore:
+    """
+    Persists the password dictionary as a snapshot (`dict.json`) plus an append-only log.
+
+    Each save compares the dictionary with the contents last written and appends one
+    `{"p": password, "d": increment}` line per changed password instead of rewriting the
+    whole dictionary, whether the dictionary was updated in place or replaced (e.g. by a
+    Gist merge). The log starts with a header naming the digest of the snapshot it
+    applies to and notes the digest of every snapshot written from it, so a crash
+    between writing a new snapshot and resetting the log can never replay increments
+    twice, while a dict.json edited by hand still gets the logged changes on top.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + LOG_SUFFIX
+        self.log_entries = 0
+        self._base = None  # digest of the snapshot the current log applies to
+        self._written = None  # contents described by the snapshot plus the log
+        self._write_lock = threading.Lock()
+
+    def load(self):
+        """Returns the snapshot with every valid log entry replayed on top of it."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            dictionary = json.load(f)
+        base = dictionary_digest(dictionary)
+        self._base = None
+        self.log_entries = 0
+        if os.path.exists(self.log_path):
+            self._replay(dictionary, base)
+        self._written = dict(dictionary)
+        return dictionary
+
+    def _replay(self, dictionary, base):
+        entries = []
+        compacted_to = set()  # digests of snapshots written from this log
+        try:
+            with open(self.log_path, "rb+") as f:
+                header = json.loads(f.readline() or b"{}")
+                good_end = f.tell()
+                for line in iter(f.readline, b""):
+                    try:
+                        entry = json.loads(line)
+                        if "compacting" in entry:
+                            compacted_to.add(entry["compacting"])
+                        else:
+                            entries.append((entry["p"], entry["d"] + 0))
+                    except (ValueError, KeyError, TypeError):
+                        # 崩溃时写了一半的最后一行，截掉以免后续追加接在残行后面
+                        f.truncate(good_end)
+                        break
+                    good_end = f.tell()
+        except (OSError, ValueError) as e:
+            print_warning(f"读取密码本变更日志失败喵，将以快照为准：{e}")
+            return
+        if header.get("base") != base:
+            if base in compacted_to:
+                # 压缩时新快照已写好、日志还没来得及重置，其中的改动已包含在快照中
+                return
+            # dict.json 在程序之外被修改过（例如手动添加密码）：把日志里的改动叠加上去，
+            # 并让下一次保存改写快照
+            if entries:
+                print_warning(
+                    f"dict.json 在程序之外被修改过喵，已将变更日志中的 {len(entries)} 条记录合并到修改后的密码本上。"
+                )
+        for password, increment in entries:
+            dictionary[password] = dictionary.get(password, 0) + increment
+        if header.get("base") == base:
+            self.log_entries = len(entries)
+            self._base = base
+
+    def _changes(self, current):
+        """Increments turning the written contents into `current`, or None if it cannot."""
+        if self._written is None:
+            return None
+        if any(password not in current for password in self._written):
+            return None  # 删除无法用增量表示，改写快照
+        return {
+            password: count - self._written.get(password, 0)
+            for password, count in current.items()
+            if password not in self._written or count != self._written[password]
+        }
+
+    def flush(self, dictionary, lock, compact=False):
+        """
+        Writes the changes made since the last flush.
+
+        `lock` guards the dictionary; it is only held while the dictionary is copied.
+        If writing fails, the same changes are written again by the next flush. With
+        `compact`, the log is folded into dict.json (used on exit, so the snapshot on
+        disk is current for anyone reading or editing it).
+        """
+        with self._write_lock:
+            with lock:
+                current = dict(dictionary)
+            changes = self._changes(current)
+            if (
+                changes is None
+                or self._base is None
+                or self.log_entries + len(changes) > COMPACT_LOG_ENTRIES
+                or (compact and (self.log_entries or changes))
+            ):
+                self._write_snapshot(current)
+            elif changes:
+                self._append(changes)
+            self._written = current
+
+    def _append(self, changes):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            for password, increment in changes.items():
+                f.write(json.dumps({"p": password, "d": increment}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_entries += len(changes)
+
+    def _write_snapshot(self, snapshot):
+        base = dictionary_digest(snapshot)
+        if os.path.exists(self.log_path):
+            # 先在旧日志中记下新快照的摘要：若在替换快照后、重置日志前崩溃，
+            # 加载时据此判断日志已合并，而不是把它当成外部修改
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"compacting": base}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        temp_log = self.log_path + ".tmp"
+        with open(temp_log, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": base}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_log, self.log_path)
+        self._base = base
+        self.log_entries = 0
@@ -0,0 +1,90 @@
+import threading
+from contextlib import contextmanager
+
+import rich.progress
+from rich import get_console
+from rich.progress import Progress
+
+# 所有模块共享同一个 Console，保证并发任务的输出不会打乱进度条
+console = get_console()
+
+_shared_progress = None
+_console_lock = threading.RLock()
+_job_context = threading.local()
+
+
+def create_shared_progress():
+    """Builds the single Progress display used when several archives extract concurrently."""
+    return Progress(
+        rich.progress.SpinnerColumn(finished_text="✅"),
+        rich.progress.TextColumn(
+            "[magenta]{task.description}",
+            table_column=rich.progress.Column(max_width=30),
+        ),
+        rich.progress.TextColumn(
+            "[cyan][b]{task.fields[filename]}[/cyan][/b]",
+            table_column=rich.progress.Column(max_width=50),
+        ),
+        rich.progress.BarColumn(),
+        "[progress.percentage]{task.percentage:>3.1f}%",
+        "•",
+        rich.progress.FileSizeColumn(),
+        "•",
+        rich.progress.TransferSpeedColumn(),
+        "•",
+        rich.progress.TimeElapsedColumn(),
+        "/",
+        rich.progress.TimeRemainingColumn(),
+        console=console,
+        transient=True,
+    )
+
+
+def set_shared_progress(progress):
+    global _shared_progress
+    _shared_progress = progress
+
+
+def set_job_label(label):
+    """Names the task rows created by the current thread in the shared display."""
+    _job_context.label = label
+
+
+def get_job_label():
+    return getattr(_job_context, "label", None)
+
+
+@contextmanager
+def progress_task(create_progress, description, total, filename=""):
+    """
+    Yields `(progress, task_id)` for one operation.
+
+    Without a shared display this opens a private Progress built by `create_progress`,
+    exactly as before; with one, it adds a row labelled with the current job instead.
+    """
+    progress = _shared_progress
+    if progress is None:
+        with create_progress() as progress:
+            task = progress.add_task(description, total=total, filename=filename)
+            yield progress, task
+        return
+
+    task = progress.add_task(get_job_label() or description, total=total, filename=filename)
+    try:
+        yield progress, task
+    finally:
+        progress.remove_task(task)
+
+
+@contextmanager
+def console_prompt():
+    """Makes the caller the single console owner while it waits for user input."""
+    with _console_lock:
+        progress = _shared_progress
+        if progress is not None:
+            progress.stop()
+        try:
+            yield
+        finally:
+            if progress is not None:
+                progress.start()
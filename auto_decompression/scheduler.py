@@ -0,0 +1,74 @@
+import os
+import threading
+import traceback
+
+from housekeeping import print_error
+from progress_display import set_job_label
+
+DEFAULT_MAX_JOBS = 1  # Concurrent top-level archives; 1 keeps the original sequential loop
+DEFAULT_MAX_JOBS_PER_DEVICE = 2  # Concurrent archives read from / written to the same device
+
+
+def device_of(path):
+    """Returns the device id of the folder holding `path` (where its output will go)."""
+    folder = os.path.dirname(os.path.abspath(path)) or "."
+    try:
+        return os.stat(folder).st_dev
+    except OSError:
+        return None
+
+
+class ExtractionScheduler:
+    """
+    Runs independent top-level archives concurrently.
+
+    A job starts only while both the global cap and the cap of its device allow it, so a
+    burst of archives from one disk cannot starve archives queued on another.
+    """
+
+    def __init__(self, worker, max_jobs=DEFAULT_MAX_JOBS, max_jobs_per_device=DEFAULT_MAX_JOBS_PER_DEVICE):
+        self.worker = worker
+        self.max_jobs = max(1, max_jobs)
+        self.max_jobs_per_device = max(1, max_jobs_per_device)
+        self.pending = []
+        self.running = 0
+        self.running_by_device = {}
+        self.condition = threading.Condition()
+
+    def submit(self, file_path):
+        with self.condition:
+            self.pending.append((file_path, device_of(file_path)))
+            self._dispatch_locked()
+
+    def busy(self):
+        with self.condition:
+            return bool(self.pending) or self.running > 0
+
+    def _dispatch_locked(self):
+        index = 0
+        while index < len(self.pending) and self.running < self.max_jobs:
+            file_path, device = self.pending[index]
+            if self.running_by_device.get(device, 0) >= self.max_jobs_per_device:
+                index += 1
+                continue
+            del self.pending[index]
+            self.running += 1
+            self.running_by_device[device] = self.running_by_device.get(device, 0) + 1
+            threading.Thread(
+                target=self._run, args=(file_path, device), daemon=True
+            ).start()
+
+    def _run(self, file_path, device):
+        set_job_label(os.path.basename(file_path))
+        try:
+            self.worker(file_path)
+        except Exception:
+            print_error(
+                f"解压 {file_path} 时出现错误喵>.< 下面是错误信息喵！\n{traceback.format_exc()}"
+            )
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.running_by_device[device] -= 1
+                self._dispatch_locked()
+                self.condition.notify_all()
@@ -0,0 +1,135 @@
+import os
+import re
+import time
+from dataclasses import dataclass
+
+READ_SIZE = 64 * 1024  # Bytes pulled from a 7z pipe per read call
+REFRESH_INTERVAL = 0.1  # Seconds between coalesced file/percent events (10 Hz)
+
+EVENT_FILE = "file"  # value: path of the member 7z started working on
+EVENT_PERCENT = "percent"  # value: overall percentage reported by -bsp1
+EVENT_COMPLETED = "completed"  # 7z printed "Everything is Ok"
+EVENT_ERROR = "error"  # value: one of the ERROR_* classes below
+
+ERROR_WRONG_PASSWORD = "wrong_password"
+ERROR_CANNOT_OPEN = "cannot_open"
+ERROR_OTHER = "other"
+
+# Result codes shared with `extract_with_7zip()`
+ERROR_RESULT_CODES = {
+    ERROR_WRONG_PASSWORD: -1,
+    ERROR_CANNOT_OPEN: -2,
+    ERROR_OTHER: -3,
+}
+
+# 7z 用 \b 回退覆盖进度行，因此 \r、\n、\b 都视为记录分隔符
+_RECORD_SEPARATOR = re.compile(rb"[\r\n\b]+")
+_PERCENT_REGEX = re.compile(r"(\d+)%")
+
+
+@dataclass
+class OutputEvent:
+    kind: str
+    value: object = None
+
+
+def classify_error_line(line: str) -> str:
+    lowered = line.lower()
+    if "wrong password" in lowered:
+        return ERROR_WRONG_PASSWORD
+    if "cannot open" in lowered or "can not open" in lowered:
+        return ERROR_CANNOT_OPEN
+    return ERROR_OTHER
+
+
+def read_chunks(stream, size=READ_SIZE):
+    """Yields raw bytes from a pipe as soon as they are available, in large blocks."""
+    fd = stream.fileno()
+    while True:
+        data = os.read(fd, size)
+        if not data:
+            return
+        yield data
+
+
+class SevenZipOutputParser:
+    """
+    Turns raw 7z stdout/stderr bytes into structured events.
+
+    File and percent updates within one refresh interval are coalesced into a single
+    event carrying the latest value, so the consumer touches the progress display at a
+    fixed rate no matter how many lines `-bb3` produces.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.error_log = ""
+        self._stdout_tail = b""
+        self._stderr_tail = b""
+        self._pending_file = None
+        self._pending_percent = None
+        self._last_emit = 0.0
+
+    @staticmethod
+    def _split_records(tail, data):
+        records = _RECORD_SEPARATOR.split(tail + data)
+        # 最后一段可能是不完整的记录，留到下一次再解析
+        return records[:-1], records[-1]
+
+    def feed_stdout(self, data: bytes) -> list:
+        records, self._stdout_tail = self._split_records(self._stdout_tail, data)
+        completed = False
+        for record in records:
+            line = record.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            if "- " in line:
+                self._pending_file = line.split("- ", 1)[1].replace("\\", "/")
+            if "%" in line:
+                match = _PERCENT_REGEX.search(line)
+                if match:
+                    self._pending_percent = int(match.group(1))
+            if "Everything is Ok" in line:
+                completed = True
+
+        now = time.monotonic()
+        if completed or now - self._last_emit >= self.refresh_interval:
+            events = self._take_pending()
+            self._last_emit = now
+        else:
+            events = []
+        if completed:
+            events.append(OutputEvent(EVENT_COMPLETED))
+        return events
+
+    def feed_stderr(self, data: bytes) -> list:
+        records, self._stderr_tail = self._split_records(self._stderr_tail, data)
+        return self._error_events(records)
+
+    def flush_stdout(self) -> list:
+        """Emits whatever stdout still buffers once the pipe reached EOF."""
+        events = self.feed_stdout(b"\n") if self._stdout_tail else []
+        events.extend(self._take_pending())
+        return events
+
+    def flush_stderr(self) -> list:
+        return self.feed_stderr(b"\n") if self._stderr_tail else []
+
+    def _take_pending(self):
+        events = []
+        if self._pending_file is not None:
+            events.append(OutputEvent(EVENT_FILE, self._pending_file))
+            self._pending_file = None
+        if self._pending_percent is not None:
+            events.append(OutputEvent(EVENT_PERCENT, self._pending_percent))
+            self._pending_percent = None
+        return events
+
+    def _error_events(self, records):
+        events = []
+        for record in records:
+            line = record.decode("utf-8", errors="replace").strip()
+            self.error_log += line + "\n"
+            if line:
+                events.append(OutputEvent(EVENT_ERROR, classify_error_line(line)))
+        return events
@@ -0,0 +1,208 @@
+import argparse
+import atexit
+import os
+import re
+import shutil
+import threading
+import uuid
+
+from filelock import FileLock, Timeout
+
+from housekeeping import create_unique_directory
+
+# 中间层压缩包放在内存文件系统中，只有最后一层才写入目标磁盘
+DEFAULT_STAGE_PARENTS = ("/dev/shm",)
+STAGE_HEADROOM = 256 * 1024 * 1024  # Free space left untouched on the stage filesystem
+
+_stage_parents = DEFAULT_STAGE_PARENTS
+_stage_budget = None  # Max bytes staged at once; None means limited by free space only
+_stage_root = None
+_stage_root_lock = None  # Held for the whole run so other instances know the root is in use
+_stage_lock = threading.Lock()
+_reserved_bytes = 0
+
+_STAGE_PREFIX = "auto_decompression-"
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value):
+    """Parses sizes such as `512M`, `2G` or `1048576` into bytes (argparse type)."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*", str(value), re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"无法识别的大小喵：{value}（示例：512M、2G）")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def configure_staging(directory=None, budget=None):
+    """
+    Selects where intermediate layers are staged and how much may be staged at once.
+
+    `directory` replaces the default tmpfs (/dev/shm), e.g. with a fast scratch disk;
+    `budget` caps the bytes of all layers staged at the same time. Must be called before
+    the first reservation.
+    """
+    global _stage_parents, _stage_budget
+    with _stage_lock:
+        if directory:
+            _stage_parents = (os.path.abspath(directory),)
+        _stage_budget = budget
+
+
+def _sweep_stale_roots(parent):
+    """Removes stage folders left behind by runs that crashed or were killed."""
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith(_STAGE_PREFIX) or name.endswith(".lock"):
+            continue
+        root = os.path.join(parent, name)
+        if not os.path.isdir(root) or os.path.islink(root):
+            continue
+        lock_path = root + ".lock"
+        if not os.path.exists(lock_path):
+            # 旧版本创建的文件夹没有锁文件，只能按名字里的 PID 判断
+            pid = name[len(_STAGE_PREFIX):].split("-", 1)[0]
+            if not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            shutil.rmtree(root, ignore_errors=True)
+            print(f"已清理异常退出的运行残留的中转文件夹喵：{root}")
+            continue
+        lock = FileLock(lock_path)
+        try:
+            lock.acquire(timeout=0)
+        except (Timeout, OSError):
+            continue  # 所属进程仍在运行
+        try:
+            shutil.rmtree(root, ignore_errors=True)
+        finally:
+            lock.release()
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+        print(f"已清理异常退出的运行残留的中转文件夹喵：{root}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # 进程存在但属于其他用户，或者无法判断
+    return True
+
+
+def _release_stage_root(root, lock):
+    shutil.rmtree(root, ignore_errors=True)
+    lock.release()
+    try:
+        os.remove(root + ".lock")
+    except OSError:
+        pass
+
+
+def _stage_root_path():
+    """Returns (and creates on first use) this process's private folder on tmpfs, or None."""
+    global _stage_root, _stage_root_lock
+    if _stage_root is not None:
+        return _stage_root or None
+    _stage_root = ""
+    for parent in _stage_parents:
+        if not os.path.isdir(parent) or not os.access(parent, os.W_OK):
+            continue
+        _sweep_stale_roots(parent)
+        root = os.path.join(parent, f"{_STAGE_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        # 先拿到锁再创建文件夹，其他实例清理残留时就不会误删
+        lock = FileLock(root + ".lock")
+        try:
+            lock.acquire(timeout=0)
+            os.makedirs(root, exist_ok=True)
+        except (Timeout, OSError):
+            if lock.is_locked:
+                lock.release()
+            continue
+        _stage_root = root
+        _stage_root_lock = lock
+        atexit.register(_release_stage_root, root, lock)
+        break
+    return _stage_root or None
+
+
+def is_staged(path):
+    """Whether `path` lies in this process's stage folder."""
+    if not _stage_root:
+        return False
+    try:
+        return os.path.commonpath([os.path.abspath(path), _stage_root]) == _stage_root
+    except ValueError:
+        return False  # 不同盘符
+
+
+def _fits_locked(root, size):
+    """Whether `size` more bytes fit in the budget and free space; call with _stage_lock held."""
+    try:
+        free = shutil.disk_usage(root).free
+    except OSError:
+        return False
+    if size + _reserved_bytes + STAGE_HEADROOM > free:
+        return False
+    if _stage_budget is not None and size + _reserved_bytes > _stage_budget:
+        return False
+    return True
+
+
+class StageReservation:
+    """A temp folder on the stage filesystem holding space for one intermediate layer."""
+
+    def __init__(self, folder, size):
+        self.folder = folder
+        self.size = size
+        self.released = False
+
+    def grow(self, size):
+        """Raises the reservation to `size` bytes; False (and unchanged) if that does not fit."""
+        global _reserved_bytes
+        with _stage_lock:
+            extra = size - self.size
+            if extra <= 0:
+                return True
+            if self.released or not _fits_locked(_stage_root, extra):
+                return False
+            _reserved_bytes += extra
+            self.size = size
+        return True
+
+    def release(self):
+        global _reserved_bytes
+        with _stage_lock:
+            if self.released:
+                return
+            self.released = True
+            _reserved_bytes -= self.size
+
+
+def reserve_stage_folder(size):
+    """
+    Creates a temp folder on the stage for an intermediate layer of `size` bytes.
+
+    Returns a `StageReservation`, or None when no stage exists, or when the layer does
+    not fit next to the layers other jobs are already staging, either in the budget or
+    in the stage's free space. The caller then extracts the layer on disk instead.
+    """
+    global _reserved_bytes
+    with _stage_lock:
+        root = _stage_root_path()
+        if root is None or not _fits_locked(root, size):
+            return None
+        _reserved_bytes += size
+    try:
+        folder = create_unique_directory(root, "temp_extract")
+    except OSError:
+        with _stage_lock:
+            _reserved_bytes -= size
+        return None
+    return StageReservation(folder, size)
@@ -1,30 +1,331 @@
+import functools
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
 
 from housekeeping import _normalize_path_for_compare, print_info
 
 
+# 一次匹配完成分类：分卷格式按原先的判定顺序排列，正则的分支顺序即匹配优先级
+_ARCHIVE_NAME_REGEX = re.compile(
+    r"""
+    (?P<part_base>.+)\.part(?P<part_index>\d+)\.rar$
+    | (?P<r_base>.+)\.r(?P<r_index>\d+)$
+    | (?P<num_base>.+)\.(?P<num_ext>7z|zip)\.(?P<num_index>\d+)$
+    | (?P<z_base>.+)\.z(?P<z_index>\d+)$
+    | .+\.(?:zip|rar|7z|iso)$
+    | .+\.tar(?:\.\w+)?$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+# split_kind -> extension of the file that acts as the set's primary part, if any
+_SPLIT_COMPANION_EXT = {"r": "rar", "z": "zip"}
+ARCHIVE_NAME_CACHE_SIZE = 65536  # Classified file names kept in memory
+
+
+class ArchiveNameInfo(NamedTuple):
+    """
+    Result of `classify_archive_name()`.
+
+    split_kind is None for regular files, otherwise one of:
+    "part" (x.partNN.rar), "r" (x.rNN), "7z" (x.7z.NNN), "zip" (x.zip.NNN), "z" (x.zNN).
+    """
+
+    is_archive: bool
+    split_kind: str
+    base_name: str
+    part_index: int
+
+
+@functools.lru_cache(maxsize=ARCHIVE_NAME_CACHE_SIZE)
+def classify_archive_name(name: str) -> ArchiveNameInfo:
+    """Classifies a file name (not a path) with a single precompiled match."""
+    m = _ARCHIVE_NAME_REGEX.match(name)
+    if m is None:
+        return ArchiveNameInfo(False, None, os.path.splitext(name)[0], None)
+    if m.group("part_base") is not None:
+        return ArchiveNameInfo(True, "part", m.group("part_base"), int(m.group("part_index")))
+    if m.group("r_base") is not None:
+        return ArchiveNameInfo(True, "r", m.group("r_base"), int(m.group("r_index")))
+    if m.group("num_base") is not None:
+        return ArchiveNameInfo(
+            True, m.group("num_ext").casefold(), m.group("num_base"), int(m.group("num_index"))
+        )
+    if m.group("z_base") is not None:
+        return ArchiveNameInfo(True, "z", m.group("z_base"), int(m.group("z_index")))
+    return ArchiveNameInfo(True, None, os.path.splitext(name)[0], None)
+
+
+DIRECTORY_INDEX_CACHE_SIZE = 64  # Directories whose index is kept between calls
+# 目录修改时间精度有限：构建索引前这么短时间内改动过的目录，复用前需再核对一次文件名列表（同 git 的 racy 检查）
+DIRECTORY_INDEX_RACY_WINDOW_NS = 2 * 1_000_000_000
+
+_directory_index_cache = OrderedDict()
+_directory_index_lock = threading.Lock()
+
+
+class DirectoryIndex:
+    """
+    One `os.scandir` snapshot of a directory with its split sets grouped up front.
+
+    Every name is classified once when the index is built; the structure helpers then
+    answer from dictionaries instead of listing the folder and running regexes again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}
+        names = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                names.append(entry.name)
+                try:
+                    if entry.is_file():
+                        self.entries[entry.name] = entry
+                except OSError:
+                    continue
+        self.names = frozenset(names)
+        self._classify()
+
+    def _classify(self):
+        # Preserve on-disk naming while allowing case-insensitive lookup of companion files.
+        self.names_by_casefold = {}
+        for name in self.entries:
+            self.names_by_casefold.setdefault(name.casefold(), []).append(name)
+
+        self.members = {}  # name -> ArchiveNameInfo of split-volume members
+        self.volumes = {}  # (split_kind, base.casefold()) -> [names]
+        for name in self.entries:
+            info = classify_archive_name(name)
+            if info.split_kind is None:
+                continue
+            self.members[name] = info
+            self.volumes.setdefault((info.split_kind, info.base_name.casefold()), []).append(name)
+        self._primary_files = None
+
+    def size(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        try:
+            # 不用 DirEntry 缓存的 stat：原地追加写入的文件不会改变目录的修改时间
+            return os.stat(entry.path).st_size
+        except OSError:
+            return None
+
+    def is_file(self, name):
+        return name in self.entries
+
+    def _volumes(self, split_kind, base):
+        return self.volumes.get((split_kind, base.casefold()), [])
+
+    def _companions(self, base, ext):
+        return self.names_by_casefold.get(f"{base}.{ext}".casefold(), [])
+
+    def related_names(self, base_name):
+        """
+        Names of the split set `base_name` belongs to (see `list_related_archive_parts`),
+        or None when it is not part of any known archive layout.
+        """
+        info = classify_archive_name(base_name)
+        if info.split_kind is not None:
+            names = list(self._volumes(info.split_kind, info.base_name))
+            companion_ext = _SPLIT_COMPANION_EXT.get(info.split_kind)
+            if companion_ext:
+                names.extend(self._companions(info.base_name, companion_ext))
+            if names or info.split_kind == "part":
+                return names
+
+        ext = os.path.splitext(base_name)[1].casefold()
+        if ext == ".7z":
+            # *.7z 与 *.7z.001 同时存在时只返回编号分卷
+            return list(self._volumes("7z", info.base_name)) or [base_name]
+        if ext == ".zip":
+            return [base_name, *self._volumes("z", info.base_name)]
+        if ext == ".rar":
+            return [base_name, *self._volumes("r", info.base_name)]
+        return None
+
+    def primary_files(self):
+        """Returns the grouped listing of `group_archive_files` (computed once)."""
+        if self._primary_files is not None:
+            return self._primary_files
+
+        groups = {"part": {}, "r": {}, "num": {}, "z": {}}
+        for name, info in self.members.items():
+            if info.split_kind in ("7z", "zip"):
+                groups["num"].setdefault((info.base_name, info.split_kind), []).append(
+                    (info.part_index, name)
+                )
+            else:
+                groups[info.split_kind].setdefault(info.base_name, []).append(
+                    (info.part_index, name)
+                )
+
+        primary_files = []
+        processed_files = set()
+        for kind in ("part", "r", "num", "z"):
+            for group_key, parts in groups[kind].items():
+                companion_ext = _SPLIT_COMPANION_EXT.get(kind)
+                companions = self._companions(group_key, companion_ext) if companion_ext else []
+                if companions:
+                    companion = companions[0]
+                    primary_files.append(companion)
+                    processed_files.add(companion)
+                else:
+                    first_part = min(parts, key=lambda item: (item[0], item[1].casefold()))[1]
+                    primary_files.append(first_part)
+                processed_files.update(name for _, name in parts)
+
+        # Add all other non-volume files
+        for name in self.entries:
+            if name not in processed_files:
+                primary_files.append(name)
+
+        self._primary_files = primary_files
+        return primary_files
+
+
+class ListingIndex(DirectoryIndex):
+    """A `DirectoryIndex` over one folder of an archive listing instead of the disk."""
+
+    def __init__(self, directory, sizes, names):
+        self.directory = directory
+        self.entries = sizes  # file name -> uncompressed size
+        self.names = frozenset(names)
+        self._classify()
+
+    def size(self, name):
+        return self.entries.get(name)
+
+
+def recursion_candidates(index, ignore_threshold):
+    """
+    Primary files of an extracted layer that are worth recursing into.
+
+    Small files that do not look like archives (readme, ads) are only there to obfuscate
+    a nested archive and are skipped when they are at most `ignore_threshold` bytes.
+    """
+    candidates = []
+    for name in index.primary_files():
+        if not index.is_file(name):
+            continue
+        # 只对“看起来不像压缩包”的文件做体积阈值过滤
+        if not is_likely_archive_filename(name):
+            size = index.size(name)
+            if size is None:
+                size = ignore_threshold + 1
+            if size <= ignore_threshold:
+                continue
+        candidates.append(name)
+    return candidates
+
+
+class LayerShape(NamedTuple):
+    """What extracting one layer will produce, predicted from its listing."""
+
+    inner: str  # Archive path of the lone archive-named file to recurse into, else None
+    inner_members: tuple  # Listing paths of `inner` and its other volumes, as 7z reports them
+    inner_size: int  # Uncompressed size of `inner_members`
+    total_size: int  # Uncompressed size of every file in the archive
+
+
+def predict_layer_shape(listing, ignore_threshold):
+    """
+    Predicts whether `recursive_extract` will recurse into a single inner archive of a
+    layer, from its `7z l -slt` listing.
+
+    Mirrors the checks made on the extracted folder: single-directory wrappers are
+    skipped, split sets are grouped and small decoys are ignored.
+    """
+    children = {}  # parent path -> {name: size, or None for folders}
+    listed_paths = {}  # normalized path -> path as listed by 7z
+    total_size = 0
+    for entry in listing.entries:
+        path = entry.path.replace("\\", "/").strip("/")
+        if not path:
+            continue
+        listed_paths[path] = entry.path
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            children.setdefault("/".join(parts[: depth - 1]), {})[parts[depth - 1]] = None
+        parent, name = "/".join(parts[:-1]), parts[-1]
+        if entry.is_dir:
+            children.setdefault(parent, {}).setdefault(name, None)
+        else:
+            children.setdefault(parent, {})[name] = entry.size
+            total_size += entry.size
+
+    root = ""
+    while True:
+        level = children.get(root, {})
+        sizes = {name: size for name, size in level.items() if size is not None}
+        index = ListingIndex(root, sizes, level)
+        if index.primary_files() or len(level) != 1:
+            break
+        only_name = next(iter(level))
+        root = f"{root}/{only_name}" if root else only_name
+
+    candidates = recursion_candidates(index, ignore_threshold)
+    inner = None
+    inner_members = ()
+    inner_size = 0
+    if len(candidates) == 1 and is_likely_archive_filename(candidates[0]):
+        # 单个大体积的非压缩文件也会被尝试递归，但几乎总是最后一层
+        volumes = index.related_names(candidates[0]) or [candidates[0]]
+        paths = [f"{root}/{name}" if root else name for name in volumes]
+        inner = paths[volumes.index(candidates[0])] if candidates[0] in volumes else paths[0]
+        inner_members = tuple(listed_paths[path] for path in paths if path in listed_paths)
+        inner_size = sum(sizes.get(name, 0) for name in volumes)
+    return LayerShape(inner, inner_members, inner_size, total_size)
+
+
+def _directory_signature(directory):
+    st = os.stat(directory)
+    return st.st_dev, st.st_ino, st.st_mtime_ns
+
+
+def get_directory_index(directory):
+    """
+    Returns the cached `DirectoryIndex` of `directory`, rebuilding it when the folder
+    changed since it was built (detected through its modification time).
+    """
+    key = _normalize_path_for_compare(directory or ".")
+    signature = _directory_signature(directory or ".")
+    with _directory_index_lock:
+        cached = _directory_index_cache.get(key)
+        if cached is not None:
+            _directory_index_cache.move_to_end(key)
+    if cached is not None and cached[0] == signature:
+        index, racy = cached[1], cached[2]
+        if not racy:
+            return index
+        if index.names == frozenset(os.listdir(directory or ".")):
+            if time.time_ns() >= signature[2] + DIRECTORY_INDEX_RACY_WINDOW_NS:
+                # 名单仍一致且已过不确定窗口，之后只需比对目录状态
+                with _directory_index_lock:
+                    _directory_index_cache[key] = (signature, index, False)
+            return index
+
+    built_at = time.time_ns()
+    index = DirectoryIndex(directory or ".")
+    racy = signature[2] >= built_at - DIRECTORY_INDEX_RACY_WINDOW_NS
+    with _directory_index_lock:
+        _directory_index_cache[key] = (signature, index, racy)
+        _directory_index_cache.move_to_end(key)
+        while len(_directory_index_cache) > DIRECTORY_INDEX_CACHE_SIZE:
+            _directory_index_cache.popitem(last=False)
+    return index
+
+
 def get_archive_base_name(filename):
     """Intelligently get the base name of a file, handling multi-volume archive extensions."""
-    basename = os.path.basename(filename)
-    
-    # Regex for different archive parts, same as in group_archive_files
-    part_regex = re.compile(r'(.+)\.part\d+\.rar$', re.IGNORECASE)
-    r_regex = re.compile(r'(.+)\.r\d+$', re.IGNORECASE)
-    num_regex = re.compile(r'(.+)\.(7z|zip)\.\d+$', re.IGNORECASE)
-    z_regex = re.compile(r'(.+)\.z\d+$', re.IGNORECASE)
-    
-    match = part_regex.match(basename) or \
-            r_regex.match(basename) or \
-            num_regex.match(basename) or \
-            z_regex.match(basename)
-            
-    if match:
-        # If it's a known multi-volume format, return the captured base name
-        return match.group(1)
-    else:
-        # Fallback for regular files (e.g., .zip, .rar, .7z)
-        return os.path.splitext(basename)[0]
+    # Split sets use the captured base name, regular files (e.g. .zip, .rar, .7z) drop the extension
+    return classify_archive_name(os.path.basename(filename)).base_name
 
 
 def list_related_archive_parts(file_path):
@@ -40,95 +341,21 @@ def list_related_archive_parts(file_path):
     """
     dir_name = os.path.dirname(file_path) or "."
     base_name = os.path.basename(file_path)
-    files = os.listdir(dir_name)
-
-    paths = set()
-
-    # *.partNN.rar
-    m = re.match(r'(.+)\.part\d+\.rar$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        pat = re.compile(rf'^{re.escape(base)}\.part\d+\.rar$', re.IGNORECASE)
-        for f in files:
-            if pat.match(f):
-                paths.add(os.path.join(dir_name, f))
-        return sorted(paths)
-
-    # *.rNN (+ .rar)
-    m = re.match(r'(.+)\.r\d+$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        rpat = re.compile(rf'^{re.escape(base)}\.r\d+$', re.IGNORECASE)
-        for f in files:
-            if rpat.match(f) or re.match(rf'^{re.escape(base)}\.rar$', f, re.IGNORECASE):
-                paths.add(os.path.join(dir_name, f))
-        if paths:
-            return sorted(paths)
-
-    # *.7z.001 or *.zip.001
-    m = re.match(r'(.+)\.(7z|zip)\.\d+$', base_name, re.IGNORECASE)
-    if m:
-        base, ext = m.group(1), m.group(2)
-        pat = re.compile(rf'^{re.escape(base)}\.{ext}\.\d+$', re.IGNORECASE)
-        for f in files:
-            if pat.match(f):
-                paths.add(os.path.join(dir_name, f))
-        if paths:
-            return sorted(paths)
-
-    # *.z01/z02... (+ .zip)
-    m = re.match(r'(.+)\.z\d+$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        zpat = re.compile(rf'^{re.escape(base)}\.z\d+$', re.IGNORECASE)
-        for f in files:
-            if zpat.match(f) or re.match(rf'^{re.escape(base)}\.zip$', f, re.IGNORECASE):
-                paths.add(os.path.join(dir_name, f))
-        if paths:
-            return sorted(paths)
-
-    # *.zip (maybe with .zNN parts)
-    m = re.match(r'(.+)\.zip$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        has_z = any(re.match(rf'^{re.escape(base)}\.z\d+$', f, re.IGNORECASE) for f in files)
-        paths.add(os.path.join(dir_name, base_name))
-        if has_z:
-            zpat = re.compile(rf'^{re.escape(base)}\.z\d+$', re.IGNORECASE)
-            for f in files:
-                if zpat.match(f):
-                    paths.add(os.path.join(dir_name, f))
-        return sorted(paths)
-
-    # *.rar (maybe with .rNN parts)
-    m = re.match(r'(.+)\.rar$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        has_r = any(re.match(rf'^{re.escape(base)}\.r\d+$', f, re.IGNORECASE) for f in files)
-        paths.add(os.path.join(dir_name, base_name))
-        if has_r:
-            rpat = re.compile(rf'^{re.escape(base)}\.r\d+$', re.IGNORECASE)
-            for f in files:
-                if rpat.match(f):
-                    paths.add(os.path.join(dir_name, f))
-        return sorted(paths)
-
-    # *.7z (maybe with .7z.001 parts)
-    m = re.match(r'(.+)\.7z$', base_name, re.IGNORECASE)
-    if m:
-        base = m.group(1)
-        has_num = any(re.match(rf'^{re.escape(base)}\.7z\.\d+$', f, re.IGNORECASE) for f in files)
-        if has_num:
-            pat = re.compile(rf'^{re.escape(base)}\.7z\.\d+$', re.IGNORECASE)
-            for f in files:
-                if pat.match(f):
-                    paths.add(os.path.join(dir_name, f))
-            return sorted(paths)
-        else:
-            return [os.path.join(dir_name, base_name)]
+    related = get_directory_index(dir_name).related_names(base_name)
+    if related is None:
+        # 默认仅返回自身
+        return [file_path]
+    return sorted(os.path.join(dir_name, name) for name in related)
 
-    # 默认仅返回自身
-    return [file_path]
+
+def get_total_split_size(file_path: str) -> int:
+    """Calculates combined size of all parts in a multi-volume archive."""
+    dir_name = os.path.dirname(file_path) or "."
+    index = get_directory_index(dir_name)
+    related = index.related_names(os.path.basename(file_path))
+    if not related:
+        return os.path.getsize(file_path)
+    return sum(index.size(name) or 0 for name in related)
 
 
 def group_archive_files(directory):
@@ -136,101 +363,12 @@ def group_archive_files(directory):
     Groups files in a directory into logical archives, handling multi-volume archives.
     Returns a list where each split archive contributes only its primary part.
     """
-    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-
-    part_regex = re.compile(r'(.+)\.part(\d+)\.rar$', re.IGNORECASE)
-    r_regex = re.compile(r'(.+)\.r(\d+)$', re.IGNORECASE)
-    num_regex = re.compile(r'(.+)\.(7z|zip)\.(\d+)$', re.IGNORECASE)
-    z_regex = re.compile(r'(.+)\.z(\d+)$', re.IGNORECASE)
-
-    # Preserve on-disk naming while allowing case-insensitive lookup of companion files.
-    lower_name_map = {}
-    for f in files:
-        lower_name_map.setdefault(f.casefold(), f)
-
-    part_groups = {}
-    r_groups = {}
-    num_groups = {}
-    z_groups = {}
-
-    for f in files:
-        m = part_regex.match(f)
-        if m:
-            base_name = m.group(1)
-            index = int(m.group(2))
-            part_groups.setdefault(base_name, []).append((index, f))
-            continue
-
-        m = r_regex.match(f)
-        if m:
-            base_name = m.group(1)
-            index = int(m.group(2))
-            r_groups.setdefault(base_name, []).append((index, f))
-            continue
-
-        m = num_regex.match(f)
-        if m:
-            base_name = m.group(1)
-            ext = m.group(2).casefold()
-            index = int(m.group(3))
-            num_groups.setdefault((base_name, ext), []).append((index, f))
-            continue
-
-        m = z_regex.match(f)
-        if m:
-            base_name = m.group(1)
-            index = int(m.group(2))
-            z_groups.setdefault(base_name, []).append((index, f))
-
-    primary_files = []
-    processed_files = set()
-
-    for _, parts in part_groups.items():
-        first_part = min(parts, key=lambda item: (item[0], item[1].casefold()))[1]
-        primary_files.append(first_part)
-        processed_files.update(name for _, name in parts)
-
-    for base_name, parts in r_groups.items():
-        rar_file = lower_name_map.get(f"{base_name}.rar".casefold())
-        if rar_file is not None:
-            primary_files.append(rar_file)
-            processed_files.add(rar_file)
-        else:
-            first_part = min(parts, key=lambda item: (item[0], item[1].casefold()))[1]
-            primary_files.append(first_part)
-        processed_files.update(name for _, name in parts)
-
-    for _, parts in num_groups.items():
-        first_part = min(parts, key=lambda item: (item[0], item[1].casefold()))[1]
-        primary_files.append(first_part)
-        processed_files.update(name for _, name in parts)
-
-    for base_name, parts in z_groups.items():
-        zip_file = lower_name_map.get(f"{base_name}.zip".casefold())
-        if zip_file is not None:
-            primary_files.append(zip_file)
-            processed_files.add(zip_file)
-        else:
-            first_part = min(parts, key=lambda item: (item[0], item[1].casefold()))[1]
-            primary_files.append(first_part)
-        processed_files.update(name for _, name in parts)
-
-    # Add all other non-volume files
-    for f in files:
-        if f not in processed_files:
-            primary_files.append(f)
-            
-    return primary_files
+    return list(get_directory_index(directory).primary_files())
 
 
 def is_split_volume_member(filename: str) -> bool:
     """Returns True when the filename is one member of a split archive set."""
-    return bool(
-        re.match(r'.+\.part\d+\.rar$', filename, re.IGNORECASE)
-        or re.match(r'.+\.r\d+$', filename, re.IGNORECASE)
-        or re.match(r'.+\.(7z|zip)\.\d+$', filename, re.IGNORECASE)
-        or re.match(r'.+\.z\d+$', filename, re.IGNORECASE)
-    )
+    return classify_archive_name(filename).split_kind is not None
 
 
 def filter_non_primary_split_inputs(file_paths):
@@ -299,23 +437,8 @@ def filter_non_primary_split_inputs(file_paths):
         filtered_paths.append(candidate_path)
 
     return filtered_paths
+
+
 def is_likely_archive_filename(name: str) -> bool:
     """Heuristic check to determine if a file is likely an archive based on its extension."""
-    lower = name.lower()
-
-    patterns = [
-        r".+\.part\d+\.rar$",       # xxx.part01.rar 等
-        r".+\.r\d+$",               # xxx.r00 等（配合 .rar）
-        r".+\.(7z|zip)\.\d+$",      # xxx.7z.001 / xxx.zip.001
-        r".+\.z\d+$",               # xxx.z01 / xxx.z02（配合 .zip）
-        r".+\.zip$",                # 单文件 zip
-        r".+\.rar$",                # 单文件 rar
-        r".+\.7z$",                 # 单文件 7z
-        r".+\.tar(\.\w+)?$",        # .tar / .tar.gz / .tar.bz2 / .tar.xz 等
-        r".+\.iso$",                # 常见镜像格式，7z 也可以解
-    ]
-
-    for pat in patterns:
-        if re.match(pat, lower, re.IGNORECASE):
-            return True
-    return False
+    return classify_archive_name(name).is_archive
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+
+from rich.table import Table
+
+from progress_display import console, get_job_label
+
+_trace_file = None
+_trace_path = None
+_trace_lock = threading.Lock()
+_totals = {}  # phase -> [count, self_seconds, total_seconds, bytes]
+_context = threading.local()
+
+
+class Span:
+    """
+    One timed phase of an extraction.
+
+    Spans nest per thread: a span's `self_time` excludes the time spent in spans opened
+    inside it, so the summary shows where time actually went without double counting.
+    """
+
+    enabled = True
+
+    def __init__(self, phase, layer=None, bytes=None, **fields):
+        stack = _span_stack()
+        parent = stack[-1] if stack else None
+        self.phase = phase
+        self.layer = layer if layer is not None else (parent.layer if parent else None)
+        self.bytes = bytes
+        self.fields = fields
+        self.child_time = 0.0
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.finished = False
+        stack.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fields.setdefault("error", exc_type.__name__)
+        self.finish()
+        return False
+
+    def finish(self, bytes=None, **fields):
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.perf_counter() - self.start
+        if bytes is not None:
+            self.bytes = bytes
+        self.fields.update(fields)
+        stack = _span_stack()
+        if self in stack:
+            # 提前 return 时内层 span 可能未结束，一并弹出
+            del stack[stack.index(self):]
+        if stack:
+            stack[-1].child_time += duration
+        _record(self, duration, max(0.0, duration - self.child_time))
+
+
+class _NullSpan:
+    """Returned while tracing is off; every operation is a no-op."""
+
+    enabled = False
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def finish(self, bytes=None, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _span_stack():
+    stack = getattr(_context, "stack", None)
+    if stack is None:
+        stack = _context.stack = []
+    return stack
+
+
+def trace_span(phase, layer=None, bytes=None, **fields):
+    """
+    Starts a span for `phase`; use it as a context manager or call `finish()`.
+
+    `layer` defaults to the layer of the enclosing span, so helpers called from
+    `recursive_extract` are attributed to the right nesting level automatically.
+    """
+    if _trace_file is None:
+        return _NULL_SPAN
+    return Span(phase, layer=layer, bytes=bytes, **fields)
+
+
+def tracing_enabled():
+    return _trace_file is not None
+
+
+def _record(span, duration, self_time):
+    record = {
+        "ts": round(span.wall_start, 6),
+        "job": get_job_label(),
+        "layer": span.layer,
+        "phase": span.phase,
+        "duration": round(duration, 6),
+        "self": round(self_time, 6),
+        "bytes": span.bytes,
+    }
+    record.update(span.fields)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_lock:
+        if _trace_file is None:
+            return
+        _trace_file.write(line + "\n")
+        totals = _totals.setdefault(span.phase, [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += self_time
+        totals[2] += duration
+        totals[3] += span.bytes or 0
+
+
+def start_tracing(folder):
+    """Opens a new JSONL trace file in `folder` and returns its path."""
+    global _trace_file, _trace_path
+    os.makedirs(folder, exist_ok=True)
+    _trace_path = os.path.join(
+        folder, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+    )
+    _trace_file = open(_trace_path, "a", encoding="utf-8", buffering=1)
+    return _trace_path
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size:.0f} B"
+        size /= 1024
+
+
+def stop_tracing():
+    """Closes the trace file and prints the per-phase summary table."""
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is None:
+            return
+        _trace_file.close()
+        _trace_file = None
+        totals = sorted(_totals.items(), key=lambda item: item[1][1], reverse=True)
+
+    table = Table(title="各阶段耗时统计喵")
+    table.add_column("阶段", style="magenta")
+    table.add_column("次数", justify="right")
+    table.add_column("自身耗时", justify="right")
+    table.add_column("总耗时", justify="right")
+    table.add_column("数据量", justify="right")
+    table.add_column("吞吐", justify="right")
+    for phase, (count, self_time, total_time, size) in totals:
+        throughput = f"{_format_size(size / total_time)}/s" if size and total_time else "-"
+        table.add_row(
+            phase,
+            str(count),
+            f"{self_time:.3f}s",
+            f"{total_time:.3f}s",
+            _format_size(size) if size else "-",
+            throughput,
+        )
+    console.print(table)
+    console.out(f"耗时追踪已写入：{_trace_path}", style="blue")